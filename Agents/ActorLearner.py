@@ -0,0 +1,254 @@
+import multiprocessing as mp
+import queue
+import random
+import time
+import traceback
+
+import numpy as np
+
+from Trajectory import one_hot
+
+# Keras does not survive a fork, so every process starts a fresh interpreter
+CONTEXT = mp.get_context("spawn")
+
+action_shape = (49,)
+obs_shape = (147,)
+
+
+def publish(weights_queue, version: int, weights: tuple):
+    """Replaces the weights in the (size 1) queue by the newest version. The old weights can still be on their way
+    into the pipe, then get_nowait misses them while the queue is full, so it is tried again until the put fits."""
+    while True:
+        try:
+            weights_queue.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            weights_queue.put((version, weights), timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+
+def rollout_worker(worker_id: int, agent_kwargs: dict, board_kwargs: dict, max_steps: int, trajectory_queue,
+                   weights_queue, stats_queue, stop_event, seed: int):
+    """Runs play_rollouts and reports a failure on the stats queue. A failing actor stops the whole run."""
+    # Trajectories that are still in the pipe when the run stops are not needed anymore
+    trajectory_queue.cancel_join_thread()
+    try:
+        play_rollouts(worker_id=worker_id, agent_kwargs=agent_kwargs, board_kwargs=board_kwargs, max_steps=max_steps,
+                      trajectory_queue=trajectory_queue, weights_queue=weights_queue, stop_event=stop_event,
+                      seed=seed)
+    except Exception:
+        stats_queue.put("Actor " + str(worker_id) + " failed:\n" + traceback.format_exc())
+        stop_event.set()
+
+
+def play_rollouts(worker_id: int, agent_kwargs: dict, board_kwargs: dict, max_steps: int, trajectory_queue,
+                  weights_queue, stop_event, seed: int):
+    """Plays games of a frozen ActorCritic snapshot against a RandomAgent and streams the trajectories of the
+    ActorCritic to the learner, tagged with the version of the weights that generated them"""
+    import Agents
+    from Board import Board
+
+    random.seed(seed)
+    np.random.seed(seed)
+    agent = Agents.ActorCritic(agent_id=1, action_shape=action_shape, obs_shape=obs_shape, debug_mode=False,
+                               **agent_kwargs)
+    opponent = Agents.RandomAgent(agent_id=2, action_shape=action_shape, obs_shape=obs_shape, debug_mode=False)
+    env = Board(agent1=agent, agent2=opponent, **board_kwargs)
+
+    # Wait for the first weights, so all actors start from the weights of the learner
+    while True:
+        if stop_event.is_set():
+            return
+        try:
+            version, weights = weights_queue.get(timeout=0.1)
+            break
+        except queue.Empty:
+            pass
+    agent.set_weights(weights)
+
+    while not stop_event.is_set():
+        try:
+            version, weights = weights_queue.get_nowait()
+            agent.set_weights(weights)
+        except queue.Empty:
+            pass
+
+        env.reset()
+        agent.reset()
+        opponent.reset()
+        steps = 0
+        done = False
+        while not done:
+            obs, action, reward, next_obs, done, mask, probs = env.step()
+            steps += 1
+            if steps >= max_steps:
+                done = True
+            env.current_player.agent.remember(state=obs, action=action, reward=reward, new_state=next_obs, done=done)
+            if action == 0 and not done:
+                env.next_player(steps)
+
+        winner = env.winner()
+        if len(agent.rewards) == 0:
+            continue
+        agent.dones[-1] = True
+        if winner is not None and winner.agent is not agent:
+            agent.rewards[-1] += env.losing_reward
+
+        trajectory = dict(worker=worker_id, version=version, steps=steps, win=int(winner is not None
+                                                                                  and winner.agent is agent),
+                          # The stored observations (codes) and indexes are sent, not the decoded states
+                          observations=agent.trajectory.observations.copy(),
+                          state_indexes=agent.trajectory.state_indexes.copy(), actions=agent.actions_single.copy(),
+                          rewards=agent.rewards.copy(), dones=agent.dones.copy(), values=agent.values.copy())
+
+        # Block while the learner is behind, but keep an eye on the stop signal
+        while not stop_event.is_set():
+            try:
+                trajectory_queue.put(trajectory, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+
+
+def learner_worker(agent_kwargs: dict, updates: int, max_policy_lag: int, trajectory_queue, weights_queues,
+                   stats_queue, stop_event, folder, run_id):
+    """Trains an ActorCritic on the incoming trajectories and publishes every new version of the weights"""
+    import Agents
+
+    # The actors stop reading their weights when the run stops
+    for weights_queue in weights_queues:
+        weights_queue.cancel_join_thread()
+
+    try:
+        agent = Agents.ActorCritic(agent_id=1, action_shape=action_shape, obs_shape=obs_shape, debug_mode=False,
+                                   **agent_kwargs)
+        version = 0
+        weights = agent.get_weights()
+        for weights_queue in weights_queues:
+            publish(weights_queue=weights_queue, version=version, weights=weights)
+
+        dropped = 0
+        while version < updates:
+            try:
+                trajectory = trajectory_queue.get(timeout=0.1)
+            except queue.Empty:
+                # Stop when an actor failed, it has reported why
+                if stop_event.is_set():
+                    return
+                continue
+            lag = version - trajectory["version"]
+            if lag > max_policy_lag:
+                dropped += 1
+                continue
+
+            states = agent.trajectory.decode(observations=trajectory["observations"])[trajectory["state_indexes"]]
+            actions = one_hot(actions=trajectory["actions"], action_count=action_shape[0])
+            # The values were estimated by the actor's snapshot of the critic
+            agent.train(states=states, actions=actions, rewards=trajectory["rewards"], dones=trajectory["dones"],
+                        values=trajectory["values"])
+
+            version += 1
+            weights = agent.get_weights()
+            for weights_queue in weights_queues:
+                publish(weights_queue=weights_queue, version=version, weights=weights)
+
+            stats_queue.put(dict(version=version, worker=trajectory["worker"], lag=lag, dropped=dropped,
+                                 steps=trajectory["steps"], win=trajectory["win"],
+                                 reward=float(np.sum(trajectory["rewards"])),
+                                 actor_loss=agent.actor_losses.last, critic_loss=agent.critic_losses.last))
+
+        if folder is not None:
+            agent.save(run_id=run_id, folder=folder)
+        stats_queue.put(None)
+    except Exception:
+        stats_queue.put("The learner failed:\n" + traceback.format_exc())
+    finally:
+        stop_event.set()
+
+
+class ActorLearner:
+    """Trains an ActorCritic with several rollout processes and one learner process. The actors play with a frozen
+    snapshot of the weights and stream their trajectories to the learner, which trains continuously and publishes
+    every new version of the weights back. Trajectories whose version lags more than max_policy_lag updates behind
+    the learner are dropped."""
+
+    def __init__(self, num_actors=None, max_policy_lag=4, max_steps=400, queue_size=None, seed=0, agent_kwargs=None,
+                 board_kwargs=None):
+        if num_actors is None:
+            num_actors = max(1, CONTEXT.cpu_count() - 1)
+
+        self.num_actors = num_actors
+        self.max_policy_lag = max_policy_lag
+        self.max_steps = max_steps
+        self.queue_size = 2 * num_actors if queue_size is None else queue_size
+        self.seed = seed
+        self.agent_kwargs = {} if agent_kwargs is None else agent_kwargs
+        self.board_kwargs = {} if board_kwargs is None else board_kwargs
+
+    def run(self, updates: int, folder=None, run_id=0, on_update=None) -> list:
+        """Trains for the given number of updates and returns the stats of every update. If folder is given, the
+        learner saves its models there. on_update is called with the stats of every update as they come in."""
+        trajectory_queue = CONTEXT.Queue(maxsize=self.queue_size)
+        weights_queues = [CONTEXT.Queue(maxsize=1) for _ in range(self.num_actors)]
+        stats_queue = CONTEXT.Queue()
+        stop_event = CONTEXT.Event()
+
+        learner = CONTEXT.Process(target=learner_worker, daemon=True,
+                                  args=(self.agent_kwargs, updates, self.max_policy_lag, trajectory_queue,
+                                        weights_queues, stats_queue, stop_event, folder, run_id))
+        actors = [CONTEXT.Process(target=rollout_worker, daemon=True,
+                                  args=(i, self.agent_kwargs, self.board_kwargs, self.max_steps, trajectory_queue,
+                                        weights_queues[i], stats_queue, stop_event, self.seed + i))
+                  for i in range(self.num_actors)]
+        learner.start()
+        for actor in actors:
+            actor.start()
+
+        stats = []
+        error = None
+        while True:
+            try:
+                s = stats_queue.get(timeout=1.0)
+            except queue.Empty:
+                if not learner.is_alive():
+                    error = "The learner stopped without reporting"
+                    break
+                if not any(actor.is_alive() for actor in actors):
+                    error = "All actors stopped without reporting"
+                    break
+                continue
+            if s is None:
+                break
+            elif isinstance(s, str):
+                error = s
+                break
+            stats.append(s)
+            if on_update is not None:
+                on_update(s)
+
+        # Actors cannot exit while their trajectories are still in the pipe
+        stop_event.set()
+        while any(actor.is_alive() for actor in actors):
+            try:
+                trajectory_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for actor in actors:
+            actor.join()
+        learner.join()
+
+        if error is not None:
+            raise Exception(error)
+        return stats
+
+
+if __name__ == "__main__":
+    start_time = time.time()
+    trainer = ActorLearner(board_kwargs=dict(auto_reward_per_step=-0.02, winning_reward=10, losing_reward=0))
+    trainer.run(updates=200, on_update=lambda s: print("Update", s["version"], "from actor", s["worker"], "lag",
+                                                        s["lag"], "steps", s["steps"], "win", s["win"], "reward",
+                                                        round(s["reward"], 2)))
+    print("Done in", round(time.time() - start_time), "sec.")
@@ -1,4 +1,7 @@
 import math
+import random
+import time
+from collections import deque
 from typing import Union, List, Tuple
 
 import numpy as np
@@ -7,21 +10,23 @@ from keras.models import Model
 from keras.optimizers import RMSprop
 from tensorflow.python.keras.models import load_model
 
+import Returns
+import Sampling
+from Inference import MLPInference
+from Statistics import RunningStat
+from Topology import TOPOLOGY
+from Trajectory import TrajectoryBuffer, one_hot
+
 
 def normalize(x: list) -> list:
     if x is None:
         raise TypeError("The list to normalize cannot be null!")
 
-    for i in x:
-        if math.isnan(i):
-            raise Exception("NaN values in input are forbidden!")
-
-    total = sum(x)
+    x = np.array(x, dtype=np.float64)
+    if np.isnan(x).any():
+        raise Exception("NaN values in input are forbidden!")
 
-    if total == 0.0:
-        return x
-
-    return [i / total for i in x]
+    return list(Sampling.normalize_rows(x[np.newaxis, :])[0])
 
 
 def use_mask(x: list, mask: List[bool]):
@@ -29,13 +34,7 @@ def use_mask(x: list, mask: List[bool]):
     if len(x) != len(mask):
         raise Exception("The length of the input list and mask are not the same!")
 
-    result = []
-    for i in range(len(x)):
-        if mask[i] is True or math.isnan(x[i]):
-            result.append(0.0)
-        else:
-            result.append(x[i])
-    return result
+    return list(Sampling.apply_mask(probs=x, masks=mask)[0])
 
 
 def simple_type_check(name, variable, expected_type):
@@ -52,12 +51,7 @@ def simple_type_check(name, variable, expected_type):
 
 
 def get_random_action(mask):
-    possible_actions = []
-    for i in range(len(mask)):
-        value = mask[i]
-        if not value:
-            possible_actions.append(i)
-    return np.random.choice(possible_actions)
+    return Sampling.sample_legal(masks=mask)[0]
 
 
 class Agent:
@@ -73,22 +67,55 @@ class Agent:
         self.action_space = list(range(self.action_shape[0]))
 
 
-        # Episodic Stats
-        self.states = []  # The states are represented by vectors with shape obs_shape
-        self.actions = []  # The one-hot action vectors with shape action_shape
-        self.actions_single = []  # The actions taken as single integers
-        self.new_states = []  # The next states, represented by vectors with shape obs_shape
-        self.rewards = []  # The rewards we have gotten every step this episode
-        self.dones = []  # A list that holds if we were done for every step
+        # Episodic Stats, see the properties below. Observations of the board are stored as uint8 codes.
+        self.trajectory = TrajectoryBuffer(obs_shape=obs_shape, action_count=action_shape[0],
+                                           quantized=tuple(obs_shape) == (TOPOLOGY.obs_size,))
 
-        # Run stats
-        self.r_wins = []  # The wins over multiple runs
-        self.r_rewards = []  # The rewards over multiple runs
+        # Run stats, one value per episode
+        self.r_wins = RunningStat()  # The wins over multiple runs
+        self.r_rewards = RunningStat()  # The rewards over multiple runs
+
+    @property
+    def states(self) -> np.ndarray:
+        """The states, represented by vectors with shape obs_shape"""
+        return self.trajectory.states
+
+    @property
+    def actions(self) -> np.ndarray:
+        """The one-hot action vectors with shape action_shape. They are built on every access."""
+        return self.trajectory.one_hot_actions()
+
+    @property
+    def actions_single(self) -> np.ndarray:
+        """The actions taken as single integers"""
+        return self.trajectory.actions
+
+    @property
+    def new_states(self) -> np.ndarray:
+        """The next states, represented by vectors with shape obs_shape"""
+        return self.trajectory.new_states
+
+    @property
+    def rewards(self) -> np.ndarray:
+        """The rewards we have gotten every step this episode"""
+        return self.trajectory.rewards
+
+    @property
+    def dones(self) -> np.ndarray:
+        """If we were done for every step"""
+        return self.trajectory.dones
+
+    @property
+    def values(self) -> np.ndarray:
+        """The value estimates at the time the actions were chosen, NaN where there is none"""
+        return self.trajectory.values
 
     def choose_action(self, obs, mask) -> Union[np.int32, int]:
         raise Exception("Do not call choose_action on Agent class directly!")
 
-    def remember(self, state, action, reward, new_state, done):
+    def remember(self, state, action, reward, new_state, done, value=None):
+        """Stores a transition. value is the estimate of the state's value at the time the action was chosen,
+        if the agent has one."""
 
         if self.debug_mode:
             self.check_states(state=state, new_state=new_state)
@@ -96,30 +123,17 @@ class Agent:
             simple_type_check("reward", reward, [float, int])
             simple_type_check("done", done, bool)
 
-        self.states.append(state)
-
-        # If our action is just an int, convert it to a one-hot representation
-        if isinstance(action, int) or isinstance(action, np.int32) or isinstance(action, np.int64):
-            a = np.zeros(shape=self.action_shape)
-            a[action] = 1.0
-            self.actions.append(a)
-            self.actions_single.append(action)
-        # If our action is a list, get the action index as the action taken
-        elif isinstance(action, list):
-            self.actions.append(action)
-            self.actions_single.append(action.index(1.0))
+        # If our action is a list, get the action index as the action taken.
+        # The one-hot vectors are only built when they are needed for learning.
+        if isinstance(action, list):
+            action = action.index(1.0)
 
-        self.rewards.append(reward)
-        self.new_states.append(new_state)
-        self.dones.append(done)
+        # The states are copied, so the board can keep overwriting its observation buffers
+        self.trajectory.append(state=state, action=action, reward=reward, new_state=new_state, done=done,
+                               value=np.nan if value is None else value)
 
     def reset(self):
-        self.states.clear()
-        self.actions.clear()
-        self.new_states.clear()
-        self.rewards.clear()
-        self.dones.clear()
-        self.actions_single.clear()
+        self.trajectory.clear()
 
     def check_states(self, state, new_state):
         if isinstance(state, list) and isinstance(new_state, list):
@@ -142,7 +156,7 @@ class Agent:
                             + str(type(state)) + " and " + str(type(new_state)) + " instead.")
 
     def check_action(self, action):
-        if isinstance(action, int) or isinstance(action, np.int32):
+        if isinstance(action, int) or isinstance(action, np.integer):
             if action < 0 or action > self.action_shape[0]:
                 raise Exception("Expected action to be between 0 (incl.) and " + str(self.action_shape[0])
                                 + " (excl.) but got " + str(action) + " instead.")
@@ -176,12 +190,7 @@ class RandomAgent(Agent):
         super().__init__(agent_id, action_shape, obs_shape, debug_mode)
 
     def choose_action(self, obs, mask) -> Tuple[Union[np.int32, int], Union[list, None]]:
-        possible_actions = []
-        for i in range(len(mask)):
-            value = mask[i]
-            if not value:
-                possible_actions.append(i)
-        return np.random.choice(possible_actions), None
+        return Sampling.sample_legal(masks=mask)[0], None
 
     def get_stats(self) -> list:
         return super(RandomAgent, self).get_stats()
@@ -190,15 +199,213 @@ class RandomAgent(Agent):
         return super(RandomAgent, self).get_stats_header()
 
 
+class MCTSNode:
+    """A node in the search tree of the MCTSAgent. A decision node is a state where a player has to choose an
+    action, a chance node is a pass of which the dice roll has not been played out yet."""
+    __slots__ = ["key", "mover", "chance", "terminal", "winner", "untried", "children", "visits", "value"]
+
+    def __init__(self, mover: int, chance=False, key=None, untried=None, terminal=False, winner=-1):
+        self.key = key  # The Board.state_key of a decision node
+        self.mover = mover  # The index of the player whose action led to this node, or -1 after a dice roll
+        self.chance = chance
+        self.terminal = terminal
+        self.winner = winner  # The index of the winning player of a terminal node
+        self.untried = untried if untried is not None else []  # The legal actions that have no child yet
+        self.children = {}  # Maps actions (or rolls, for chance nodes) to the child nodes
+        self.visits = 0
+        self.value = 0.0  # The summed results, seen from the perspective of the mover
+
+
+class MCTSAgent(Agent):
+    """Plays by Monte Carlo tree search over the rules of the Board it is attached to. Passes lead to chance nodes
+    for the dice roll, leaves are evaluated with a cheap rollout policy and the tree is reused between decisions."""
+
+    def __init__(self, agent_id, action_shape, obs_shape, debug_mode, simulations=500, time_budget=None,
+                 exploration=1.4, rollout_depth=60, reuse_nodes=5000, seed=None):
+        super(MCTSAgent, self).__init__(agent_id, action_shape, obs_shape, debug_mode)
+
+        if simulations is None and time_budget is None:
+            raise Exception("The MCTSAgent needs a simulation and/or a time budget!")
+
+        self.simulations = simulations  # The maximum number of simulations per decision
+        self.time_budget = time_budget  # The maximum number of seconds per decision
+        self.exploration = exploration  # The UCT exploration constant
+        self.rollout_depth = rollout_depth  # The number of actions after which a rollout is evaluated heuristically
+        self.reuse_nodes = reuse_nodes  # How many nodes of the old tree are searched for the new root
+        self.rng = random.Random(seed)
+
+        self.board = None  # The board this agent plays on
+        self.sim_board = None  # A clone of the board that is used for the simulations
+        self.player_index = -1  # The index of this agent in board.players
+        self.root = None
+
+    def attach(self, board):
+        """Sets the Board this agent plays on. Needs to be called before the first choose_action."""
+        self.board = board
+        self.sim_board = board.clone()
+        self.sim_board.debug_mode = False
+        self.player_index = [p.agent for p in board.players].index(self)
+        self.root = None
+
+    def roll(self) -> int:
+        return self.rng.randint(1, 3) + self.rng.randint(1, 3)
+
+    def new_decision_node(self, board, mover: int, done: bool) -> MCTSNode:
+        if done:
+            return MCTSNode(mover=mover, terminal=True, winner=board.current_player_index)
+        return MCTSNode(mover=mover, key=board.state_key(), untried=board.legal_actions(board.current_player))
+
+    def find_root(self, key) -> Union[MCTSNode, None]:
+        """Searches the old tree for the node of the current state, so its statistics can be reused"""
+        if self.root is None:
+            return None
+        queue = deque([self.root])
+        searched = 0
+        while len(queue) > 0 and searched < self.reuse_nodes:
+            node = queue.popleft()
+            searched += 1
+            if not node.chance and node.key == key:
+                return node
+            queue.extend(node.children.values())
+        return None
+
+    def select(self, node: MCTSNode) -> Tuple[int, MCTSNode]:
+        """Returns the action and child with the highest UCT score"""
+        log_visits = math.log(node.visits)
+        best_score = -math.inf
+        best = None
+        for action, child in node.children.items():
+            score = child.value / child.visits + self.exploration * math.sqrt(log_visits / child.visits)
+            if score > best_score:
+                best_score = score
+                best = (action, child)
+        return best
+
+    def rollout_policy(self, legal_actions: list) -> int:
+        # Build a village whenever possible, otherwise do anything that is legal
+        villages = [a for a in legal_actions if a != 0 and a % 2 == 0]
+        return self.rng.choice(villages if len(villages) > 0 else legal_actions)
+
+    def rollout(self, board, pass_pending: bool) -> float:
+        """Plays the game out from the board and returns the result for this agent between -1 and 1"""
+        if pass_pending:
+            board.next_player(step=0, roll=self.roll())
+
+        for _ in range(self.rollout_depth):
+            action = self.rollout_policy(board.legal_actions(board.current_player))
+            _, done = board.apply_action(action=action)
+            if done:
+                return 1.0 if board.current_player_index == self.player_index else -1.0
+            if action == 0:
+                board.next_player(step=0, roll=self.roll())
+
+        # Evaluate unfinished games by the difference in villages
+        own = len(board.players[self.player_index].villages)
+        other = len(board.players[1 - self.player_index].villages)
+        return (own - other) / board.points_to_win
+
+    def simulate(self, root: MCTSNode, root_state):
+        board = self.sim_board
+        board.restore(state=root_state)
+        node = root
+        path = [node]
+
+        while not node.terminal:
+            if node.chance:
+                roll = self.roll()
+                board.next_player(step=0, roll=roll)
+                child = node.children.get(roll)
+                if child is None:
+                    child = node.children[roll] = self.new_decision_node(board=board, mover=-1, done=False)
+                    path.append(child)
+                    break
+                node = child
+                path.append(node)
+            elif len(node.untried) > 0:
+                action = node.untried.pop(self.rng.randrange(len(node.untried)))
+                mover = board.current_player_index
+                _, done = board.apply_action(action=action)
+                if action == 0:
+                    child = MCTSNode(mover=mover, chance=True)
+                else:
+                    child = self.new_decision_node(board=board, mover=mover, done=done)
+                node.children[action] = child
+                node = child
+                path.append(node)
+                break
+            else:
+                action, node = self.select(node=node)
+                board.apply_action(action=action)
+                path.append(node)
+
+        if node.terminal:
+            result = 1.0 if node.winner == self.player_index else -1.0
+        else:
+            result = self.rollout(board=board, pass_pending=node.chance)
+
+        for n in path:
+            n.visits += 1
+            if n.mover >= 0:
+                n.value += result if n.mover == self.player_index else -result
+
+    def choose_action(self, obs, mask) -> Tuple[int, Union[None, list]]:
+        if self.board is None:
+            raise Exception("The MCTSAgent needs to be attached to a board before it can choose actions!")
+
+        legal_actions = [i for i in range(len(mask)) if not mask[i]]
+        if len(legal_actions) == 1:
+            return legal_actions[0], None
+
+        key = self.board.state_key()
+        root = self.find_root(key=key)
+        if root is None:
+            root = self.new_decision_node(board=self.board, mover=-1, done=False)
+        root_state = self.board.snapshot()
+
+        start_time = time.time()
+        simulations = 0
+        # At least one simulation is run, so there is always an action to choose from
+        while simulations == 0 or ((self.simulations is None or simulations < self.simulations)
+                                   and (self.time_budget is None or time.time() - start_time < self.time_budget)):
+            self.simulate(root=root, root_state=root_state)
+            simulations += 1
+
+        # Choose the most visited action, the visit counts double as the action probabilities
+        probs = [0.0] * self.action_shape[0]
+        for action, child in root.children.items():
+            probs[action] = child.visits / max(root.visits, 1)
+        action = max(root.children, key=lambda a: root.children[a].visits)
+
+        self.root = root.children[action]
+        return action, probs
+
+    def reset(self):
+        super(MCTSAgent, self).reset()
+        self.root = None
+
+    def get_config(self) -> dict:
+        config = super(MCTSAgent, self).get_config()
+        config["Simulations: "] = str(self.simulations)
+        config["Time Budget: "] = str(self.time_budget)
+        config["Exploration: "] = str(self.exploration)
+        config["Rollout Depth: "] = str(self.rollout_depth)
+        return config
+
+
 class ActorCritic(Agent):
     def __init__(self, agent_id, action_shape, obs_shape, debug_mode, actor_learning_rate=0.001,
                  actor_loss_type='mean_squared_error', critic_loss_type='mean_squared_error',
-                 critic_learning_rate=0.001, discount_factor=0.99, batch_size=100):
+                 critic_learning_rate=0.001, discount_factor=0.99, batch_size=100, update_episodes=1,
+                 update_transitions=None, epochs=1):
 
         super(ActorCritic, self).__init__(agent_id, action_shape, obs_shape, debug_mode)
         # General learning parameters
         self.discount_factor = discount_factor
-        self.batch_size = batch_size
+        self.batch_size = batch_size  # The size of the minibatches
+        # The networks are updated once update_episodes episodes or update_transitions transitions were collected
+        self.update_episodes = update_episodes
+        self.update_transitions = update_transitions
+        self.epochs = epochs  # How often the collected transitions are trained on per update
         # Actor parameters
         self.actor_learning_rate = actor_learning_rate
         self.actor_loss_type = actor_loss_type
@@ -207,10 +414,20 @@ class ActorCritic(Agent):
         self.critic_loss_type = critic_loss_type
 
         self.actor, self.critic = self.build_actor_critic_network()
+        # Acting goes through the NumPy copy of the networks, Keras is only used for training
+        self.inference = MLPInference(actor=self.actor, critic=self.critic)
+
+        # The value of the last state an action was chosen for, it is stored with the transition by remember
+        self.last_value = np.nan
+
+        # The transitions of the episodes since the last update
+        self.experience = TrajectoryBuffer(obs_shape=obs_shape, action_count=action_shape[0],
+                                           quantized=self.trajectory.quantized)
+        self.experience_episodes = 0
 
         # Run stats
-        self.actor_losses = []
-        self.critic_losses = []
+        self.actor_losses = RunningStat()
+        self.critic_losses = RunningStat()
 
     def build_actor_critic_network(self):
         inp = Input(shape=self.obs_shape)
@@ -228,45 +445,33 @@ class ActorCritic(Agent):
 
         return actor, critic
 
-    def discount_rewards(self, reward):
-        # Compute the gamma-discounted rewards over an episode
-        running_add = 0
-        discounted_r = np.zeros_like(reward, dtype=np.float)
-        for i in reversed(range(0, len(reward))):
-            # if reward[i] != 0:  # reset the sum, since this was a game boundary (pong specific!)
-            #   running_add = 0
-            running_add = running_add * self.discount_factor + reward[i]
-            discounted_r[i] = running_add
-
-        # discounted_r -= np.mean(discounted_r)  # normalizing the result
-        mean = np.mean(discounted_r)
-        mean = -1 * mean if not np.isnan(mean).any() else 0
-        discounted_r = np.add(discounted_r, mean)
-        std = np.std(discounted_r)
-        if np.isnan(std).any() or std == 0:
-            std = 1
-        discounted_r /= std  # divide by standard deviation
-        return discounted_r
+    def discount_rewards(self, reward, dones=None):
+        # Compute the normalized gamma-discounted rewards over one or more episodes, see Returns
+        return Returns.normalize(Returns.discounted_returns(rewards=reward, dones=dones,
+                                                            discount_factor=self.discount_factor))
 
     def choose_action(self, obs, mask) -> Tuple[int, Union[None, list]]:
         state = obs[np.newaxis, :]
-        original_probabilities = self.actor.predict(state)[0]
-
+        # The actor and critic are evaluated in one pass, the value is kept for the transition of this action.
+        # The prediction is a view of the buffers of the inference engine, sample_action takes a copy.
+        probabilities, values = self.inference.evaluate(state)
+        self.last_value = float(values[0])
+        return self.sample_action(original_probabilities=probabilities[0], mask=mask)
+
+    def remember(self, state, action, reward, new_state, done, value=None):
+        if value is None:
+            value = self.last_value
+        self.last_value = np.nan
+        super(ActorCritic, self).remember(state, action, reward, new_state, done, value=value)
+
+    def sample_action(self, original_probabilities, mask) -> Tuple[int, Union[None, list]]:
+        """Chooses an action from the output of the actor, limited to the legal actions of the mask"""
         if len(original_probabilities) != len(mask):
             raise Exception("The length of the mask and the action-probabilities do no match!")
 
-        masked_probabilities = use_mask(x=original_probabilities, mask=mask)
-        normalized_probabilities = normalize(x=masked_probabilities)
-
-        sum_norm_prob = sum(normalized_probabilities)
-        if abs(sum_norm_prob - 1) > 0.000001 and sum_norm_prob != 0.0:
-            raise Exception("The normalized probabilities do not sum to 1 and are not 0.0! Sum:" + str(sum_norm_prob))
-        elif sum_norm_prob == 0.0:
-            action = get_random_action(mask=mask)
-        else:
-            action = np.random.choice(a=self.action_space, p=normalized_probabilities)
-
-        return action, original_probabilities[:]
+        # If no legal action has any probability left, a random legal action is chosen
+        action = Sampling.sample(probs=original_probabilities, masks=mask)[0]
+        return action, np.array(original_probabilities, dtype=np.float64)
 
     def load(self, run_id, folder=None):
         if folder is None:
@@ -275,6 +480,7 @@ class ActorCritic(Agent):
         else:
             self.actor = load_model(filepath=folder + "\\actor" + run_id + ".h5", compile=False)
             self.critic = load_model(filepath=folder + "\\actor" + run_id + ".h5", compile=False)
+        self.inference = MLPInference(actor=self.actor, critic=self.critic)
 
     def save(self, run_id, folder=None):
         if folder is None:
@@ -285,27 +491,65 @@ class ActorCritic(Agent):
             self.critic.save(filepath=folder + "\\" + 'critic' + str(run_id) + str(self.agent_id) + '.h5')
 
     def finish(self, folder: str, run_id: int):
-        self.learn()
-        self.save(run_id=run_id, folder=folder)
+        self.experience.extend(self.trajectory)
+        self.experience_episodes += 1
 
-    def learn(self):
-        # reshape memory to appropriate shape for training
-        states = np.vstack(self.states)
-        actions = np.vstack(self.actions)
+        # The losses only get a value in the episodes with an update, the Logger writes NaN in the others
+        if self.update_due():
+            self.learn()
+            self.save(run_id=run_id, folder=folder)
+
+    def update_due(self) -> bool:
+        if self.update_episodes is not None and self.experience_episodes >= self.update_episodes:
+            return True
+        return self.update_transitions is not None and len(self.experience) >= self.update_transitions
+
+    def get_weights(self) -> tuple:
+        return self.actor.get_weights(), self.critic.get_weights()
 
+    def set_weights(self, weights: tuple):
+        actor_weights, critic_weights = weights
+        self.actor.set_weights(actor_weights)
+        self.critic.set_weights(critic_weights)
+        self.inference.refresh()
+
+    def learn(self):
+        """Trains on the episodes collected since the last update"""
+        experience = self.experience
+        self.train(states=experience.states, actions=experience.one_hot_actions(), rewards=experience.rewards,
+                   dones=experience.dones, values=experience.values)
+        experience.clear()
+        self.experience_episodes = 0
+
+    def train(self, states: np.ndarray, actions: np.ndarray, rewards, dones=None, values=None):
+        """Trains the actor and critic on the states, one-hot actions and rewards of one or more episodes. The
+        advantages are computed once, after which the transitions are shuffled into minibatches every epoch.
+        values are the critic's estimates recorded while acting, the missing (NaN) ones are predicted here."""
         # Compute discounted rewards
-        discounted_r = self.discount_rewards(self.rewards)
+        discounted_r = self.discount_rewards(rewards, dones=dones)
 
-        # Get Critic network predictions
-        values = self.critic.predict(states)[:, 0]
+        # Get Critic network predictions, where they were not recorded
+        values = np.full(len(states), np.nan) if values is None else np.array(values, dtype=np.float64)
+        missing = np.isnan(values)
+        if missing.any():
+            values[missing] = self.critic.predict(states[missing])[:, 0]
         # Compute advantages
         advantages = discounted_r - values
-        # training Actor and Critic networks
-        ah = self.actor.fit(states, actions, sample_weight=advantages, verbose=0, batch_size=self.batch_size)
-        ch = self.critic.fit(states, discounted_r, verbose=0, batch_size=self.batch_size)
 
-        self.actor_losses.append(ah.history['loss'][0])
-        self.critic_losses.append(ch.history['loss'][0])
+        # training Actor and Critic networks
+        actor_losses = []
+        critic_losses = []
+        for _ in range(self.epochs):
+            order = np.random.permutation(len(states))
+            for start in range(0, len(order), self.batch_size):
+                batch = order[start:start + self.batch_size]
+                actor_losses.append(self.actor.train_on_batch(states[batch], actions[batch],
+                                                              sample_weight=advantages[batch]))
+                critic_losses.append(self.critic.train_on_batch(states[batch], discounted_r[batch]))
+
+        self.actor_losses.append(float(np.mean(actor_losses)))
+        self.critic_losses.append(float(np.mean(critic_losses)))
+        self.inference.refresh()
 
     def get_stats_header(self) -> list:
         base = super(ActorCritic, self).get_stats_header()
@@ -321,6 +565,9 @@ class ActorCritic(Agent):
         config = super(ActorCritic, self).get_config()
         config["Discount factor: "] = str(self.discount_factor)
         config["Batch Size: "] = str(self.batch_size)
+        config["Update Episodes: "] = str(self.update_episodes)
+        config["Update Transitions: "] = str(self.update_transitions)
+        config["Epochs: "] = str(self.epochs)
 
         config["\n Actor Parameters: "] = ""
         config["Actor Learning Rate: "] = str(self.actor_learning_rate)
@@ -354,12 +601,9 @@ class DoubleActorCritic(Agent):
         self.master_actor, self.slave_actor, self.critic = self.build_actor_critic_network()
 
         # Run stats
-        self.master_actor_losses = []
-        self.slave_actor_losses = []
-        self.critic_losses = []
-
-        self.master_actor_actions = []
-        self.slave_actor_actions = []
+        self.master_actor_losses = RunningStat()
+        self.slave_actor_losses = RunningStat()
+        self.critic_losses = RunningStat()
 
     def build_actor_critic_network(self):
         resource_input = Input(shape=(3,))
@@ -386,25 +630,10 @@ class DoubleActorCritic(Agent):
 
         return master_actor, slave_actor, critic
 
-    def discount_rewards(self, reward):
-        # Compute the gamma-discounted rewards over an episode
-        running_add = 0
-        discounted_r = np.zeros_like(reward, dtype=np.float)
-        for i in reversed(range(0, len(reward))):
-            # if reward[i] != 0:  # reset the sum, since this was a game boundary (pong specific!)
-            #   running_add = 0
-            running_add = running_add * self.discount_factor + reward[i]
-            discounted_r[i] = running_add
-
-        # discounted_r -= np.mean(discounted_r)  # normalizing the result
-        mean = np.mean(discounted_r)
-        mean = -1 * mean if not np.isnan(mean).any() else 0
-        discounted_r = np.add(discounted_r, mean)
-        std = np.std(discounted_r)
-        if np.isnan(std).any() or std == 0:
-            std = 1
-        discounted_r /= std  # divide by standard deviation
-        return discounted_r
+    def discount_rewards(self, reward, dones=None):
+        # Compute the normalized gamma-discounted rewards over one or more episodes, see Returns
+        return Returns.normalize(Returns.discounted_returns(rewards=reward, dones=dones,
+                                                            discount_factor=self.discount_factor))
 
     def choose_action(self, obs, mask) -> Tuple[int, Union[None, list]]:
         # If we can only pass, return pass
@@ -420,8 +649,8 @@ class DoubleActorCritic(Agent):
         master_probabilities = self.master_actor.predict(resources)[0]
         slave_probabilities = self.slave_actor.predict(gp_input)[0]
 
-        master_action = np.random.choice([0, 1, 2], p=master_probabilities)
-        slave_action = np.random.choice(list(range(24)), p=slave_probabilities)
+        master_action = Sampling.sample(probs=master_probabilities, masks=np.zeros(3, dtype=bool))[0]
+        slave_action = Sampling.sample(probs=slave_probabilities, masks=np.zeros(24, dtype=bool))[0]
 
         if master_action == 0:
             action = 0
@@ -457,41 +686,24 @@ class DoubleActorCritic(Agent):
         self.learn()
         self.save(run_id=run_id, folder=folder)
 
-    def remember(self, state, action, reward, new_state, done):
-        super(DoubleActorCritic, self).remember(state, action, reward, new_state, done)
-        if action == 0:
-            master_action = [1.0, 0.0, 0.0]
-            slave_action = [1.0 / 24.0] * 24
-        else:
-            index = int(action % 2)
-            master_action = [0.0, 0.0, 0.0]
-            master_action[index] = 1.0
-            slave_action = [0.0] * 24
-            index = int(math.floor((action - 1) / 2))
-            slave_action[index] = 1.0
-        self.master_actor_actions.append(master_action)
-        self.slave_actor_actions.append(slave_action)
+    def action_labels(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Splits the actions taken into the one-hot labels of the master and the slave actor. A pass has no
+        gridpoint, so its slave label is uniform."""
+        actions = self.actions_single
+        passes = actions == 0
+        master_actor_labels = one_hot(actions=actions % 2, action_count=3)
+        slave_actor_labels = one_hot(actions=np.maximum(actions - 1, 0) // 2, action_count=24)
+        slave_actor_labels[passes] = 1.0 / 24.0
+        return master_actor_labels, slave_actor_labels
 
     def learn(self):
-        # reshape memory to appropriate shape for training
-
-        master_actor_input = []
-        slave_actor_input = []
-        for i in range(len(self.states)):
-            state = self.states[i]
-            master_actor_input.append(state[:3])
-            slave_actor_input.append(state[3:])
-
-        states = np.vstack(self.states)
-        master_actor_input = np.vstack(master_actor_input)
-        slave_actor_input = np.vstack(slave_actor_input)
-
-        # actions = np.vstack(self.actions)
-        master_actor_labels = np.vstack(self.master_actor_actions)
-        slave_actor_labels = np.vstack(self.slave_actor_actions)
+        states = self.states
+        master_actor_input = states[:, :3]
+        slave_actor_input = states[:, 3:]
+        master_actor_labels, slave_actor_labels = self.action_labels()
 
         # Compute discounted rewards
-        discounted_r = self.discount_rewards(self.rewards)
+        discounted_r = self.discount_rewards(self.rewards, dones=self.dones)
 
         # Get Critic network predictions
         values = self.critic.predict(states)[:, 0]
@@ -0,0 +1,210 @@
+import asyncio
+import time
+from typing import Callable, List
+
+import numpy as np
+
+import Agents
+from Board import Board
+from Statistics import RunningStat
+
+
+class InferenceQueue:
+    """Collects the observations of many games and evaluates them with one predict call. A batch is evaluated as
+    soon as max_batch observations are waiting, or max_wait seconds after the first one came in. predict returns
+    an array or a tuple of arrays with one row per observation, every waiting observation gets its row(s)."""
+
+    def __init__(self, predict: Callable, obs_shape: tuple, max_batch=64, max_wait=0.002):
+        self.predict_batch = predict
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.buffer = np.zeros((max_batch,) + obs_shape, dtype=np.float32)
+        self.pending = []  # The (obs, future) pairs that are waiting for a prediction
+        self.batch_sizes = RunningStat()  # The sizes of the evaluated batches
+        self.has_pending = None
+        self.is_full = None
+
+    async def predict(self, obs: np.ndarray) -> np.ndarray:
+        """Returns the prediction for a single observation once its batch has been evaluated"""
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((obs, future))
+        self.has_pending.set()
+        if len(self.pending) >= self.max_batch:
+            self.is_full.set()
+        return await future
+
+    async def serve(self):
+        """Evaluates the pending observations until it is cancelled"""
+        self.has_pending = asyncio.Event()
+        self.is_full = asyncio.Event()
+        while True:
+            await self.has_pending.wait()
+            if len(self.pending) < self.max_batch:
+                try:
+                    await asyncio.wait_for(self.is_full.wait(), timeout=self.max_wait)
+                except asyncio.TimeoutError:
+                    pass
+
+            batch = self.pending[:self.max_batch]
+            del self.pending[:self.max_batch]
+            if len(self.pending) < self.max_batch:
+                self.is_full.clear()
+            if len(self.pending) == 0:
+                self.has_pending.clear()
+
+            states = self.buffer[:len(batch)]
+            for i, (obs, _) in enumerate(batch):
+                states[i] = obs
+            try:
+                # The predictions can be views of the buffers of the inference engine
+                predictions = self.predict_batch(states)
+                if isinstance(predictions, tuple):
+                    predictions = list(zip(*[np.array(p) for p in predictions]))
+                else:
+                    predictions = np.array(predictions)
+            except Exception as e:
+                # The game of a future that is done was cancelled while it waited
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batch_sizes.append(len(batch))
+            for (_, future), prediction in zip(batch, predictions):
+                if not future.done():
+                    future.set_result(prediction)
+
+
+class AsyncRunner:
+    """Plays many games at the same time as coroutines in one thread. The ActorCritic agents do not predict their
+    actions one by one, but share an InferenceQueue per agent, so the observations of all games are evaluated in
+    batches. The agents are shared by all games, so every game keeps its own transitions and hands them to the
+    agents when it is done, after which the agents learn like they do in SimpleCatan."""
+
+    def __init__(self, agents: list, concurrency=32, max_batch=None, max_wait=0.002, max_steps=400, folder=None,
+                 run_id=0, board_kwargs=None):
+        if len(agents) != 2:
+            raise Exception("The AsyncRunner needs exactly 2 agents, got " + str(len(agents)))
+
+        self.agents = agents
+        self.concurrency = concurrency
+        self.max_batch = concurrency if max_batch is None else max_batch
+        self.max_wait = max_wait
+        self.max_steps = max_steps
+        self.folder = folder  # Where the agents save their models, see Agent.finish
+        self.run_id = run_id
+        self.board_kwargs = {} if board_kwargs is None else board_kwargs
+
+        self.queues = {}  # Maps the index of every ActorCritic agent to its InferenceQueue
+        for i, agent in enumerate(agents):
+            if isinstance(agent, Agents.ActorCritic):
+                self.queues[i] = InferenceQueue(predict=agent.inference.evaluate, obs_shape=agent.obs_shape,
+                                                max_batch=self.max_batch, max_wait=max_wait)
+
+        self.episode = 0
+        self.results = []  # Per finished game, (steps, ID of the winner or 0)
+
+    async def choose_action(self, index: int, obs: np.ndarray, mask: list) -> tuple:
+        """Returns the action, the probabilities and the value estimate (None if the agent has none)"""
+        agent = self.agents[index]
+        if index in self.queues:
+            probabilities, value = await self.queues[index].predict(obs=obs)
+            action, probs = agent.sample_action(original_probabilities=probabilities, mask=mask)
+            return action, probs, float(value)
+        action, probs = agent.choose_action(obs=obs, mask=mask)
+        return action, probs, None
+
+    async def play(self, board: Board) -> int:
+        """Plays one game on the board and returns the number of steps"""
+        board.reset()
+        transitions = [[] for _ in board.players]
+        steps = 0
+        done = False
+
+        while not done:
+            index = board.current_player_index
+            player = board.current_player
+            mask = board.get_mask(player=player)
+            # get_obs returns the cached buffer of the player, which the board overwrites when it changes, so keep
+            # a copy for the transition
+            obs = np.array(board.get_obs(player=player))
+
+            action, probs, value = await self.choose_action(index=index, obs=obs, mask=mask)
+            if mask[action]:
+                legal_actions = [c for c in range(len(mask)) if not mask[c]]
+                raise Exception("Something went wrong. An illegal action was chosen. Action taken:" + str(action)
+                                + ". Possible legal actions:" + str(legal_actions))
+
+            reward, done = board.apply_action(action=action)
+            steps += 1
+            if steps >= self.max_steps:
+                done = True
+
+            next_obs = obs if action == 0 else np.array(board.get_obs(player=player))
+            transitions[index].append((obs, int(action), reward, next_obs, done, value))
+
+            if action == 0 and not done:
+                board.next_player(steps)
+
+        self.finish(board=board, transitions=transitions, steps=steps)
+        return steps
+
+    def finish(self, board: Board, transitions: list, steps: int):
+        """Replays the transitions of a finished game into the agents and lets them learn"""
+        winner = board.winner()
+        for player, player_transitions in zip(board.players, transitions):
+            agent = player.agent
+            agent.reset()
+            for obs, action, reward, next_obs, done, value in player_transitions:
+                agent.remember(state=obs, action=action, reward=reward, new_state=next_obs, done=done, value=value)
+
+            if len(agent.rewards) > 0:
+                # Make sure that the last is on done
+                agent.dones[-1] = True
+                # If we are done, but not the winner, we need to compensate.
+                if player != winner and winner is not None:
+                    agent.rewards[-1] += board.losing_reward
+
+            agent.r_wins.append(int(player == winner))
+            agent.r_rewards.append(float(agent.rewards.sum()))
+            agent.finish(folder=self.folder, run_id=self.run_id)
+
+        self.results.append((steps, 0 if winner is None else winner.ID))
+
+    async def play_games(self, board: Board, episodes: int):
+        while self.episode < episodes:
+            self.episode += 1
+            await self.play(board=board)
+
+    async def main(self, episodes: int):
+        servers = [asyncio.ensure_future(q.serve()) for q in self.queues.values()]
+        await asyncio.sleep(0)
+        boards = [Board(agent1=self.agents[0], agent2=self.agents[1], **self.board_kwargs)
+                  for _ in range(min(self.concurrency, episodes))]
+        try:
+            await asyncio.gather(*[self.play_games(board=board, episodes=episodes) for board in boards])
+        finally:
+            for server in servers:
+                server.cancel()
+            await asyncio.gather(*servers, return_exceptions=True)
+
+    def run(self, episodes: int) -> List[tuple]:
+        """Plays the given number of games and returns the (steps, winner ID) of each of them"""
+        self.episode = 0
+        self.results = []
+        asyncio.run(self.main(episodes=episodes))
+        return self.results
+
+
+if __name__ == "__main__":
+    action_shape = (49,)
+    obs_shape = (147,)
+    AGENTS = [Agents.ActorCritic(agent_id=1, action_shape=action_shape, obs_shape=obs_shape, debug_mode=False),
+              Agents.RandomAgent(agent_id=2, action_shape=action_shape, obs_shape=obs_shape, debug_mode=False)]
+
+    start_time = time.time()
+    runner = AsyncRunner(agents=AGENTS, concurrency=32,
+                         board_kwargs=dict(auto_reward_per_step=-0.02, winning_reward=10, losing_reward=0))
+    results = runner.run(episodes=200)
+    print("Played", len(results), "games in", round(time.time() - start_time, 2), "sec. Wins:",
+          sum(int(w == 1) for _, w in results), "Average batch size:", round(runner.queues[0].batch_sizes.mean, 2))
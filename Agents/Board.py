@@ -1,57 +1,101 @@
 import math
 import random
-from typing import Union, Tuple, Any
+from typing import Union, Tuple, Any, TYPE_CHECKING
 
 import numpy as np
 
-import Agents
+from Topology import TOPOLOGY, LUMBER, BRICK, GRAIN, DESERT
+
+if TYPE_CHECKING:
+    # Only for the annotations, so processes that just step boards do not load Keras
+    import Agents
 
-# Resource Types
-LUMBER = 0
-BRICK = 1
-GRAIN = 2
-DESERT = 3
 VILLAGE = 1
 STREET = 0
 
+# Spreads the 8 bits of a byte to the even bits of 16, used to interleave gridpoint masks into action masks
+SPREAD_BYTE = [sum(((b >> i) & 1) << (2 * i) for i in range(8)) for b in range(256)]
+
+
+def bits(x: int):
+    """Yields the indexes of the set bits of x"""
+    while x:
+        low = x & -x
+        yield low.bit_length() - 1
+        x ^= low
+
+
+def spread(x: int) -> int:
+    """Moves bit i of a gridpoint mask to bit 2 * i"""
+    return SPREAD_BYTE[x & 0xFF] | (SPREAD_BYTE[(x >> 8) & 0xFF] << 16) | (SPREAD_BYTE[(x >> 16) & 0xFF] << 32)
+
+
+def expand_mask(legal: int, size=49) -> list:
+    """Expands a legal-action bitmask to the bool list used by the agents, where True means illegal"""
+    return [not (legal >> a) & 1 for a in range(size)]
+
 
 class Player:
-    def __init__(self, ID: int, agent: Agents.Agent):
+    def __init__(self, ID: int, agent: "Agents.Agent"):
         self.ID = ID
-        self.resources = [0, 0, 0]
+        self.resources = np.zeros(3, dtype=np.int64)  # A view of the row of this player in Board.resources
         self.villages = []  # The gp indexes where there are villages
         self.streets = set()  # All gp indexes that are currently reached by streets of this player
         self.street_count = 0
         self.agent = agent
         self.valueable_steps = []
+        self.valueable_step_set = set()  # The same steps as valueable_steps, for O(1) lookups
+        self.village_mask = 0  # The bitmask of the gps with villages of this player
+        self.street_mask = 0  # The bitmask of self.streets
+        self.taken_mask = 0  # The bitmask of the actions this player has built this episode
+        # The gps this player could build on, kept up to date by every building. Whether the player can pay for it
+        # is checked when the mask is put together, see Board.get_mask_bits.
+        self.village_options = 0  # The free gps reached by own streets
+        self.street_options = 0  # The gps one unbuilt street away from an own building or street
+        # The observation columns as seen by this player: 1 for own buildings, -1 for others and 1 for reached gps
+        self.building_obs = np.zeros(TOPOLOGY.gridpoint_count, dtype=np.float32)
+        self.street_obs = np.zeros(TOPOLOGY.gridpoint_count, dtype=np.float32)
+        # The cached observation from the perspective of this player, see Board.get_obs
+        self.obs = TOPOLOGY.obs_template.copy()
+        self.obs_version = -1  # The board version the cached observation belongs to
+        self.dirty_gridpoints = set()  # The gps whose columns in the cached observation are out of date
 
     def reset(self):
-        self.resources = [0, 0, 0]
+        self.resources.fill(0)
         self.villages.clear()
         self.streets.clear()
         self.street_count = 0
         self.valueable_steps.clear()
-
-    def give_res(self, step, res_id):
-        self.resources[res_id] += 1
-        if not (step in self.valueable_steps):
+        self.valueable_step_set.clear()
+        self.village_mask = 0
+        self.street_mask = 0
+        self.taken_mask = 0
+        self.village_options = 0
+        self.street_options = 0
+        self.building_obs.fill(0.0)
+        self.street_obs.fill(0.0)
+
+    def received_res(self, step):
+        """Keeps track of the bookkeeping after the board added resources to this player"""
+        if step not in self.valueable_step_set:
+            self.valueable_step_set.add(step)
             self.valueable_steps.append(step)
 
 
     def auto_trade(self):
         """Automatically trade excess resources for resources you have the least of"""
-        h = max(self.resources)
-        l = min(self.resources)
-        hres = self.resources.index(h)
-        lres = self.resources.index(l)
+        hres = int(self.resources.argmax())
+        lres = int(self.resources.argmin())
+        h = self.resources[hres]
+        l = self.resources[lres]
 
         while h > 3 and l < h - 3:
             self.resources[hres] -= 3
             self.resources[lres] += 1
-            h = max(self.resources)
-            l = min(self.resources)
-            hres = self.resources.index(h)
-            lres = self.resources.index(l)
+            hres = int(self.resources.argmax())
+            lres = int(self.resources.argmin())
+            h = self.resources[hres]
+            l = self.resources[lres]
 
     def choose_action(self, obs, mask) -> int:
         return self.agent.choose_action(obs=obs, mask=mask)
@@ -63,58 +107,28 @@ class Player:
         return self.agent.get_stats()
 
 
-class GridPoint:
-    def __init__(self, index, tiles, gps):
-        self.index = index
-        self.resource_values = [0, 0, 0]
-
-        for tile in tiles:
-            if tile.resource > 2:
-                continue
-            self.resource_values[tile.resource] += tile.probability
-
-        self.robber = 0
-        self.building = 0
-        self.connected_tiles = tiles
-        self.connected_gridpoints = {}
-        for gp in gps:
-            self.connected_gridpoints[gp] = 0
-
-    def reset(self):
-        self.robber = 0
-        self.building = 0
-        for gp_index in self.connected_gridpoints.keys():
-            self.connected_gridpoints[gp_index] = 0
-
-    def get_obs(self, player):
-        obs = self.resource_values[:]
-        if self.building == 0:
-            obs.append(0.0)
-        else:
-            obs.append(1.0 if self.building == player.ID else -1.0)
-        obs.append(1.0 if self.index in player.streets else 0.0)
-        obs.append(int(self.robber) * -1.0)
-        return obs
-
-
-class Tile:
-    def __init__(self, index, res, number, gps):
+def roll_dice() -> int:
+    return random.randint(1, 3) + random.randint(1, 3)  # Roll a number with 2d3
 
-        if res < 0 or res > 3:
-            raise Exception("Invalid resource" + str(res) + "number when creating Tile!")
-        elif len(gps) != 6:
-            raise Exception(
-                "Error creating Tile. Not the right amount to GridPoints (6 required, " + str(len(gps)) + " given)")
 
-        self.index = index  # The index of this Tile in the Board.tiles list
-        self.resource = res  # The resource that this tile contains
-        self.number = number  # The number that needs to be thrown with dice to get res from this tile
-        self.probability = 0.25 - 0.0625 * abs(5 - number)
-        self.robber = 0
-        self.connected_gridpoints = gps
+class BoardState:
+    """A compact copy of the mutable state of a Board, without the agents. See Board.snapshot."""
+    __slots__ = ["buildings", "connections", "robber", "occupied", "blocked", "open_neighbours", "resources",
+                 "production", "current_player_index", "players"]
 
-    def reset(self):
-        self.robber = 0
+    def __init__(self, board):
+        self.buildings = tuple(board.buildings)
+        self.connections = dict(board.connections)
+        self.robber = board.robber
+        self.occupied = board.occupied
+        self.blocked = board.blocked
+        self.open_neighbours = tuple(board.open_neighbours)
+        self.resources = board.resources.copy()
+        self.production = board.production.copy()
+        self.current_player_index = board.current_player_index
+        # Everything of the players that is not derived from the rest of the state
+        self.players = tuple((tuple(p.villages), p.street_count, p.village_mask, p.street_mask, p.taken_mask,
+                              tuple(p.valueable_steps)) for p in board.players)
 
 
 def actionIsVillage(x: int) -> bool:
@@ -124,81 +138,133 @@ def actionIsVillage(x: int) -> bool:
 
 
 class Board:
-    def __init__(self, agent1: Agents.Agent, agent2: Agents.Agent, winning_reward=10, points_to_win=3,
-                 auto_reward_per_step=-0.01, losing_reward=-10):
+    def __init__(self, agent1: "Agents.Agent", agent2: "Agents.Agent", winning_reward=10, points_to_win=3,
+                 auto_reward_per_step=-0.01, losing_reward=-10, debug_mode=False):
         self.players = [Player(ID=agent1.agent_id, agent=agent1), Player(ID=agent2.agent_id, agent=agent2)]
+        # The resources of all players, every player holds a view of its own row
+        self.resources = np.zeros((len(self.players), 3), dtype=np.int64)
+        for index, player in enumerate(self.players):
+            player.resources = self.resources[index]
         self.current_player_index = 0  # The index of the player that's currently in turn
         self.current_player = self.players[self.current_player_index]  # The actual player that is currently in turn
         self.points_to_win = points_to_win
         self.winning_reward = winning_reward
         self.losing_reward = losing_reward
         self.auto_reward_per_step = auto_reward_per_step
-        self.tiles = []
-        self.gridpoints = []  # A GP is a tuple : (building, connectd_tile_indexes[])
-        self.connections = {}  # A 2D array that contains information about the gp-connections
-        self.robber = 0
-
-    def create_tgc(self):
-        """Creates the tiles, GPs and connections for the board"""
-        self.tiles = [Tile(index=0, res=DESERT, number=0, gps=[7, 8, 11, 12, 15, 16]),
-                      Tile(index=1, res=LUMBER, number=5, gps=[0, 1, 3, 4, 7, 8]),
-                      Tile(index=2, res=BRICK, number=2, gps=[4, 5, 8, 9, 12, 13]),
-                      Tile(index=3, res=BRICK, number=5, gps=[12, 13, 16, 17, 20, 21]),
-                      Tile(index=4, res=GRAIN, number=3, gps=[15, 16, 19, 20, 22, 23]),
-                      Tile(index=5, res=LUMBER, number=6, gps=[10, 11, 14, 15, 18, 19]),
-                      Tile(index=6, res=GRAIN, number=3, gps=[2, 3, 6, 7, 10, 11])]
-
-        self.gridpoints = [GridPoint(index=0, tiles=[self.tiles[1]], gps=[1, 3]),
-                           GridPoint(index=1, tiles=[self.tiles[1]], gps=[0, 4]),
-                           GridPoint(index=2, tiles=[self.tiles[6]], gps=[3, 6]),
-                           GridPoint(index=3, tiles=[self.tiles[1], self.tiles[6]], gps=[0, 2, 7]),
-                           GridPoint(index=4, tiles=[self.tiles[1], self.tiles[2]], gps=[1, 5, 8]),
-                           GridPoint(index=5, tiles=[self.tiles[2]], gps=[4, 9]),
-                           GridPoint(index=6, tiles=[self.tiles[6]], gps=[2, 10]),
-                           GridPoint(index=7, tiles=[self.tiles[0], self.tiles[1], self.tiles[6]], gps=[3, 8, 11]),
-                           GridPoint(index=8, tiles=[self.tiles[0], self.tiles[1], self.tiles[2]], gps=[4, 7, 12]),
-                           GridPoint(index=9, tiles=[self.tiles[2]], gps=[5, 13]),
-                           GridPoint(index=10, tiles=[self.tiles[5], self.tiles[6]], gps=[6, 11, 14]),
-                           GridPoint(index=11, tiles=[self.tiles[0], self.tiles[5], self.tiles[6]], gps=[7, 10, 15]),
-                           GridPoint(index=12, tiles=[self.tiles[0], self.tiles[2], self.tiles[3]], gps=[8, 13, 16]),
-                           GridPoint(index=13, tiles=[self.tiles[2], self.tiles[3]], gps=[9, 12, 17]),
-                           GridPoint(index=14, tiles=[self.tiles[5]], gps=[10, 18]),
-                           GridPoint(index=15, tiles=[self.tiles[0], self.tiles[4], self.tiles[5]], gps=[11, 16, 19]),
-                           GridPoint(index=16, tiles=[self.tiles[0], self.tiles[3], self.tiles[4]], gps=[12, 15, 20]),
-                           GridPoint(index=17, tiles=[self.tiles[3]], gps=[13, 21]),
-                           GridPoint(index=18, tiles=[self.tiles[5]], gps=[14, 19]),
-                           GridPoint(index=19, tiles=[self.tiles[4], self.tiles[5]], gps=[15, 18, 22]),
-                           GridPoint(index=20, tiles=[self.tiles[3], self.tiles[4]], gps=[16, 21, 23]),
-                           GridPoint(index=21, tiles=[self.tiles[3]], gps=[17, 20]),
-                           GridPoint(index=22, tiles=[self.tiles[4]], gps=[19, 23]),
-                           GridPoint(index=23, tiles=[self.tiles[4]], gps=[20, 22])]
+        self.debug_mode = debug_mode  # If True, the cached masks and observations are checked every step
+        self.topology = TOPOLOGY  # The static layout, shared by all boards
+
+        # The mutable state. Everything static is looked up in self.topology.
+        self.buildings = [0] * TOPOLOGY.gridpoint_count  # Per gp, the ID of the player with a building there or 0
+        self.connections = {}  # Maps the (low, high) gp indexes of every street to the ID of its owner
+        self.robber = -1  # The index of the tile with the robber, -1 if it has not been placed yet
+        self.occupied = 0  # The bitmask of all gps with a building
+        self.blocked = 0  # The bitmask of all gps that are occupied or next to an occupied gp
+        self.open_neighbours = list(TOPOLOGY.neighbour_masks)  # Per gp, the neighbours not connected by a street
+        self.robber_obs = np.zeros(TOPOLOGY.gridpoint_count, dtype=np.float32)  # -1 for the gps next to the robber
+        # Per dice roll, how much of every resource every player receives given the current buildings and robber
+        self.production = np.zeros((len(TOPOLOGY.production), len(self.players), 3), dtype=np.int64)
+
+        # Incremented by every change of the state, used to tell if the cached observations are up to date
+        self.version = 0
+        # Holds the observation from before an action, so step can hand out the cached one as next_obs
+        self.obs_buffer = self.new_obs_buffer()
+
+        # If enabled, build_building, dice_roll and next_player push a snapshot that undo can go back to
+        self.undo_enabled = False
+        self.undo_stack = []
+
+    def snapshot(self) -> BoardState:
+        """Returns a copy of the state of the board that restore can go back to"""
+        return BoardState(board=self)
+
+    def restore(self, state: BoardState):
+        """Sets the board to the state of a snapshot. The snapshot itself is not changed, so it can be reused."""
+        self.buildings[:] = state.buildings
+        self.connections = dict(state.connections)
+        self.robber = state.robber
+        self.occupied = state.occupied
+        self.blocked = state.blocked
+        self.open_neighbours[:] = state.open_neighbours
+        self.resources[:] = state.resources
+        self.production[:] = state.production
+        self.current_player_index = state.current_player_index
+        self.current_player = self.players[self.current_player_index]
+
+        self.robber_obs.fill(0.0)
+        if self.robber >= 0:
+            self.robber_obs[list(self.topology.tile_gridpoints[self.robber])] = -1.0
+
+        buildings = np.array(self.buildings)
+        self.version += 1
+        for player, (villages, street_count, village_mask, street_mask, taken_mask, valueable_steps) \
+                in zip(self.players, state.players):
+            player.villages[:] = villages
+            player.street_count = street_count
+            player.village_mask = village_mask
+            player.street_mask = street_mask
+            player.taken_mask = taken_mask
+            player.streets = set(bits(street_mask))
+            player.valueable_steps[:] = valueable_steps
+            player.valueable_step_set = set(valueable_steps)
+
+            # Rebuild everything that is derived from the state
+            player.village_options = self.legal_villages(player=player, free=False)
+            player.street_options = self.legal_streets(player=player)
+            player.building_obs[:] = np.where(buildings == 0, 0.0, np.where(buildings == player.ID, 1.0, -1.0))
+            player.street_obs[:] = [(street_mask >> gp_index) & 1 for gp_index in range(self.topology.gridpoint_count)]
+            self.write_obs(player=player, out=player.obs)
+            player.dirty_gridpoints.clear()
+            player.obs_version = self.version
+
+    def clone(self):
+        """Returns a new board in the same state. The agents are shared, not copied."""
+        board = Board(agent1=self.players[0].agent, agent2=self.players[1].agent, winning_reward=self.winning_reward,
+                      points_to_win=self.points_to_win, auto_reward_per_step=self.auto_reward_per_step,
+                      losing_reward=self.losing_reward, debug_mode=self.debug_mode)
+        board.restore(state=self.snapshot())
+        return board
+
+    def push_undo(self):
+        if self.undo_enabled:
+            self.undo_stack.append(self.snapshot())
+
+    def undo(self):
+        """Reverts the last build_building, dice_roll or next_player"""
+        if len(self.undo_stack) == 0:
+            raise Exception("There is nothing to undo!")
+        self.restore(state=self.undo_stack.pop())
 
     def place_robber(self):
 
         best_tile = None
         highest = -100
 
-        for tile in self.tiles:
-            if tile.robber == 1:
+        for tile in range(self.topology.tile_count):
+            if tile == self.robber:
                 continue
 
             tile_value = 0
-            for gp_index in tile.connected_gridpoints:
-                gp = self.gridpoints[gp_index]
+            for gp_index in self.topology.tile_gridpoints[tile]:
+                building = self.buildings[gp_index]
 
-                if gp.building == 0:
+                if building == 0:
                     continue
 
-                if gp.building != self.players[self.current_player_index].ID:
-                    tile_value += tile.probability
+                if building != self.players[self.current_player_index].ID:
+                    tile_value += self.topology.tile_probabilities[tile]
 
             if tile_value > highest:
                 best_tile = tile
                 highest = tile_value
 
-        self.tiles[self.robber].robber = 0  # Set the old robber location to robber = 0
-        self.robber = best_tile.index  # Set the robber to the new location
-        best_tile.robber = 1  # Make sure the new robber tile has a good reference
+        if self.robber >= 0:
+            self.mark_dirty(gridpoints=self.topology.tile_gridpoints[self.robber])
+        self.mark_dirty(gridpoints=self.topology.tile_gridpoints[best_tile])
+        self.robber = best_tile  # Set the robber to the new location
+        self.update_production()
+        self.robber_obs.fill(0.0)
+        self.robber_obs[list(self.topology.tile_gridpoints[best_tile])] = -1.0
 
     def handle_robber(self):
         for player in self.players:
@@ -215,158 +281,216 @@ class Board:
                     so_far += player.resources[res_index]
                     if so_far >= random_index:
                         player.resources[res_index] -= 1
+                        self.version += 1
                         break
 
                 throw_away -= 1
 
     def dice_roll(self, step):
         """ Roll the dice and distribute the resources """
-        roll = random.randint(1, 3) + random.randint(1, 3)  # Roll a number with 2d4
+        self.push_undo()
+        self.distribute_resources(step=step, roll=roll_dice())
+
+    def distribute_resources(self, step, roll: int):
+        self.version += 1
 
         if roll == 4:
             i = 1
             # self.place_robber()
             # self.handle_robber()
-        else:
-            # Go through all tiles
-            for tile in self.tiles:
-                # If we come across a tile with as number the same as the roll
-                if tile.number == roll and tile.robber == 0:
-                    for gp_index in tile.connected_gridpoints:
-                        gp = self.gridpoints[gp_index]
-                        if gp.building != 0:
-                            #self.players[gp.building - 1].resources[tile.resource] += 1
-                            self.players[gp.building - 1].give_res(step=step, res_id=tile.resource)
-
-    def get_mask(self, player: Player) -> list:
+        elif roll < len(self.production):
+            gains = self.production[roll]
+            self.resources += gains
+            for index, player in enumerate(self.players):
+                if gains[index].any():
+                    player.received_res(step=step)
+
+    def add_production(self, gridpoint: int, player_index: int):
+        """Adds what a village of the player on the gridpoint produces to the production table"""
+        for tile, number, res in self.topology.gridpoint_production[gridpoint]:
+            if tile != self.robber:
+                self.production[number, player_index, res] += 1
+
+    def update_production(self):
+        """Recomputes the production table from the buildings and the robber"""
+        self.production.fill(0)
+        for gp_index in bits(self.occupied):
+            self.add_production(gridpoint=gp_index, player_index=self.buildings[gp_index] - 1)
+
+    def legal_villages(self, player: Player, free: bool) -> int:
+        """Returns the bitmask of the gps where the player can place a village"""
+        legal = self.topology.all_gridpoints & ~self.blocked
+        if not free:
+            legal &= player.street_mask
+        return legal
+
+    def legal_streets(self, player: Player) -> int:
+        """Returns the bitmask of the gps the player can build a street towards"""
+        legal = 0
+        for gp_index in bits(player.village_mask | player.street_mask):
+            legal |= self.open_neighbours[gp_index]
+        return legal
+
+    def compute_mask_bits(self, player: Player) -> int:
+        """Computes the bitmask of the legal actions of the player from scratch. Bit a is set if a is legal."""
 
         # If our player has not build any villages yet, we are in the initial phase of the game
         if len(player.villages) < 1:
-            mask = [True]
-            for action_number in range(1, 49):
-
-                # If we want to build a street, we can't! We need to build a village first.
-                if not actionIsVillage(action_number):
-                    mask.append(True)
-                # If we want to build a village...
-                else:
-                    gi = math.floor((action_number - 1) / 2)
-                    mask.append(not self.eligible_for_village(gridpoint=self.gridpoints[gi], free=True))
-
-            return mask
+            return spread(self.legal_villages(player=player, free=True)) << 2
+        # After the first village, the first street needs to be placed
         elif player.street_count < 1:
-            mask = [True]
-            for action_number in range(1, 49):
-                # If we want to build a village, we can't in the initial phase
-                if actionIsVillage(x=action_number):
-                    mask.append(True)
-                else:
-                    gi = math.floor((action_number - 1) / 2)
-                    mask.append(not self.eligible_for_street(gridpoint=self.gridpoints[gi]))
-            return mask
-
+            return spread(self.legal_streets(player=player)) << 1
+
+        legal = 1
+        if player.resources[0] >= 1 and player.resources[1] >= 1 and player.resources[2] >= 1:
+            legal |= spread(self.legal_villages(player=player, free=False)) << 2
+        if player.resources[0] >= 1 and player.resources[1] >= 1 and player.street_count < 7:
+            legal |= spread(self.legal_streets(player=player)) << 1
+        # Actions that have already been taken this episode cannot be chosen again
+        return legal & ~player.taken_mask
+
+    def get_mask_bits(self, player: Player) -> int:
+        """Returns the legal-action bitmask of the player. It is put together from the building options of the
+        player, which build_building keeps up to date, and the resource thresholds, so resource changes need no
+        bookkeeping."""
+        if len(player.villages) < 1:
+            legal = spread(self.topology.all_gridpoints & ~self.blocked) << 2
+        elif player.street_count < 1:
+            legal = spread(player.street_options) << 1
         else:
-            mask = [False]
-            for action_number in range(1, 49):
-                gi = math.floor((action_number - 1) / 2)
-                if action_number in player.agent.actions_single:
-                    mask.append(True)
-                # We want to build a village!
-                elif actionIsVillage(x=action_number):
-                    if player.resources[0] < 1:
-                        mask.append(True)
-                    elif player.resources[1] < 1:
-                        mask.append(True)
-                    elif player.resources[2] < 1:
-                        mask.append(True)
-                    elif not self.eligible_for_village(gridpoint=self.gridpoints[gi], free=False):
-                        mask.append(True)
-                    else:
-                        mask.append(False)
-                # We want to build a street!
-                else:
-                    if player.resources[0] < 1 or player.resources[1] < 1:
-                        mask.append(True)
-                    elif player.street_count >= 7:
-                        mask.append(True)
-                    elif not self.eligible_for_street(gridpoint=self.gridpoints[gi]):
-                        mask.append(True)
-                    else:
-                        mask.append(False)
+            legal = 1
+            if player.resources[0] >= 1 and player.resources[1] >= 1 and player.resources[2] >= 1:
+                legal |= spread(player.village_options) << 2
+            if player.resources[0] >= 1 and player.resources[1] >= 1 and player.street_count < 7:
+                legal |= spread(player.street_options) << 1
+            legal &= ~player.taken_mask
+
+        if self.debug_mode:
+            expected = self.compute_mask_bits(player=player)
+            if legal != expected:
+                raise Exception("The mask of player " + str(player.ID) + " is out of date. Legal actions:"
+                                + str([a for a in range(49) if (legal >> a) & 1]) + ", recomputed:"
+                                + str([a for a in range(49) if (expected >> a) & 1]))
+        return legal
 
-            return mask
-
-    def get_obs(self, player: Player) -> list:
-        obs = player.resources[:]
-        for gp in self.gridpoints:
-            obs.extend(gp.get_obs(player=player))
+    def get_mask(self, player: Player) -> list:
+        return expand_mask(self.get_mask_bits(player=player))
+
+    def new_obs_buffer(self) -> np.ndarray:
+        """Returns a float32 observation buffer with the static resource columns already filled in"""
+        return self.topology.obs_template.copy()
+
+    def mark_dirty(self, gridpoints, players=None):
+        """Marks the observation columns of the gridpoints as changed for the players, by default both"""
+        self.version += 1
+        for player in self.players if players is None else players:
+            player.dirty_gridpoints.update(gridpoints)
+
+    def write_obs(self, player: Player, out: np.ndarray) -> np.ndarray:
+        """Writes all dynamic columns of the observation of the player into out"""
+        # Every gridpoint takes up 6 values after the 3 resources, the first 3 of those are static
+        out[:3] = player.resources
+        out[6::6] = player.building_obs
+        out[7::6] = player.street_obs
+        out[8::6] = self.robber_obs
+        return out
+
+    def get_obs(self, player: Player, out=None) -> np.ndarray:
+        """Returns the observation of the player. With out, a buffer from new_obs_buffer, it is written into out.
+        Otherwise the cached observation of the player is returned. It is only patched where the state has changed
+        since the last call and stays valid until the next call for this player."""
+        if out is not None:
+            return self.write_obs(player=player, out=out)
+
+        obs = player.obs
+        if player.obs_version != self.version:
+            obs[:3] = player.resources
+            for gp_index in player.dirty_gridpoints:
+                offset = 6 + 6 * gp_index
+                obs[offset] = player.building_obs[gp_index]
+                obs[offset + 1] = player.street_obs[gp_index]
+                obs[offset + 2] = self.robber_obs[gp_index]
+            player.dirty_gridpoints.clear()
+            player.obs_version = self.version
+
+        if self.debug_mode:
+            expected = self.write_obs(player=player, out=self.new_obs_buffer())
+            if not np.array_equal(obs, expected):
+                raise Exception("The cached observation of player " + str(player.ID) + " is out of date at indexes "
+                                + str(np.flatnonzero(obs != expected).tolist()))
         return obs
 
-    def eligible_for_village(self, gridpoint: GridPoint, free: bool) -> bool:
-
-        # If this gridpoint is already occupied, we can't place a village here
-        if gridpoint.building != 0:
-            return False
-
-        # If one of our neighbours is occupied, we can't build here
-        for neighbour_index in gridpoint.connected_gridpoints.keys():
-            neighbour = self.gridpoints[neighbour_index]
-            if neighbour.building != 0:
-                return False
-
-        # If we don't have free placement and we are not connected to the street network, return False
-        if not free and not (gridpoint.index in self.players[self.current_player_index].streets):
-            return False
-
-        return True
+    def eligible_for_village(self, gridpoint: int, free: bool) -> bool:
+        player = self.players[self.current_player_index]
+        return bool((self.legal_villages(player=player, free=free) >> gridpoint) & 1)
 
-    def eligible_for_street(self, gridpoint: GridPoint) -> bool:
+    def eligible_for_street(self, gridpoint: int) -> bool:
+        player = self.players[self.current_player_index]
+        return bool((self.legal_streets(player=player) >> gridpoint) & 1)
 
-        for neighbour_index in gridpoint.connected_gridpoints.keys():
-            # If this connection is already saturated with a street, this neighbour does not have to be checked
-            if gridpoint.connected_gridpoints[neighbour_index] != 0:
-                continue
-
-            neighbour = self.gridpoints[neighbour_index]
-            # If our neighbour has a building on it that belongs to the current player,
-            # OR if our neighbour is connected to the street network of the current player...
-            # we have found a connection
-            if neighbour.building == self.players[self.current_player_index].ID \
-                    or neighbour_index in self.players[self.current_player_index].streets:
-                return True
-
-        return False
-
-    def find_connection(self, player: Player, gridpoint: GridPoint) -> GridPoint:
+    def find_connection(self, player: Player, gridpoint: int) -> int:
         connection = None
-        for neighbour_index in gridpoint.connected_gridpoints.keys():
-            neighbour = self.gridpoints[neighbour_index]
-            if neighbour.building == player.ID or neighbour.index in player.streets:
-                connection = neighbour
+        for neighbour_index in self.topology.gridpoint_neighbours[gridpoint]:
+            if self.buildings[neighbour_index] == player.ID or neighbour_index in player.streets:
+                connection = neighbour_index
         if connection is None:
-            raise Exception("No connection found for player " + str(player.ID) + " to GP " + gridpoint.index)
+            raise Exception("No connection found for player " + str(player.ID) + " to GP " + str(gridpoint))
         return connection
 
     def build_building(self, village: bool, gridpoint: int, player: Player) -> float:
         """Builds a building and returns the reward"""
+        self.push_undo()
+        player.taken_mask |= 1 << (2 * gridpoint + 1 + int(village))
+
         if village:
             player.villages.append(gridpoint)  # Append the gridpoint to the players' curriculum
-            self.gridpoints[gridpoint].building = player.ID
+            self.buildings[gridpoint] = player.ID
+            self.add_production(gridpoint=gridpoint, player_index=self.players.index(player))
+            for p in self.players:
+                p.building_obs[gridpoint] = 1.0 if p is player else -1.0
+            self.mark_dirty(gridpoints=(gridpoint,))
+            player.village_mask |= 1 << gridpoint
+            self.occupied |= 1 << gridpoint
+            newly_blocked = (1 << gridpoint) | self.topology.neighbour_masks[gridpoint]
+            self.blocked |= newly_blocked
+            # Nobody can build a village next to it anymore, and the player can build streets away from it
+            for p in self.players:
+                p.village_options &= ~newly_blocked
+            player.street_options |= self.open_neighbours[gridpoint]
 
             # Remove the resources
             if len(player.villages) > 1:
-                player.resources = [r - 1 for r in player.resources]
+                player.resources -= 1
             return 1.0  # Return the gained resource
 
         # We want to build a street.
         else:
             player.street_count += 1
             player.streets.add(gridpoint)
-            gp = self.gridpoints[gridpoint]
-            connection = self.find_connection(player=player, gridpoint=gp)
-            player.streets.add(connection.index)
+            connection = self.find_connection(player=player, gridpoint=gridpoint)
+            player.streets.add(connection)
+            new_streets = ((1 << gridpoint) | (1 << connection)) & ~player.street_mask
+            newly_reached = new_streets & ~player.village_mask
+            player.street_mask |= new_streets
+            player.street_obs[gridpoint] = player.street_obs[connection] = 1.0
+            self.mark_dirty(gridpoints=(gridpoint, connection), players=(player,))
             # Connect the gridpoints
-            gp.connected_gridpoints[connection.index] = connection.connected_gridpoints[gridpoint] = player.ID
+            self.connections[(min(gridpoint, connection), max(gridpoint, connection))] = player.ID
+            self.open_neighbours[gridpoint] &= ~(1 << connection)
+            self.open_neighbours[connection] &= ~(1 << gridpoint)
+
+            # Update the options: the player can build villages and streets from the gps it newly reaches, and the
+            # street between gridpoint and connection is taken for every player that reaches either end
+            player.village_options |= new_streets & ~self.blocked
+            for gp_index in bits(newly_reached):
+                player.street_options |= self.open_neighbours[gp_index]
+            for p in self.players:
+                reached = p.village_mask | p.street_mask
+                for gp_index in (gridpoint, connection):
+                    if self.open_neighbours[gp_index] & reached:
+                        p.street_options |= 1 << gp_index
+                    else:
+                        p.street_options &= ~(1 << gp_index)
             if player.street_count > 1:
                 player.resources[0] -= 1
                 player.resources[1] -= 1
@@ -378,11 +502,13 @@ class Board:
                 return player
         return None
 
-    def next_player(self, step):
-        """Gives the turn to the next player and automatically rolls the dice and starts the auto trade"""
+    def next_player(self, step, roll=None):
+        """Gives the turn to the next player and automatically rolls the dice and starts the auto trade.
+        The roll can be given to play out a specific outcome of the dice."""
         winner = self.winner()
         if not (winner is None):
             raise Exception("Cannot go to next player if the game is already done! Winner is player " + str(winner.ID))
+        self.push_undo()
 
         # Get the next index
         self.current_player_index += 1
@@ -392,27 +518,21 @@ class Board:
         # Set the current_player to the right value
         self.current_player = self.players[self.current_player_index]
         # Roll the dice
-        self.dice_roll(step=step)
+        self.distribute_resources(step=step, roll=roll_dice() if roll is None else roll)
         # Initiate auto trade
         self.current_player.auto_trade()
+        self.version += 1
 
-    def step(self) -> Tuple[np.ndarray, Any, float, Union[np.ndarray, Any], bool, list, Any]:
-
-        # The mask and observation of the current player
-        mask = self.get_mask(player=self.current_player)
-        obs = np.array(self.get_obs(player=self.current_player))
+    def legal_actions(self, player: Player) -> list:
+        return list(bits(self.get_mask_bits(player=player)))
 
-        # Let the current player choose an action
-        action, probs = self.current_player.choose_action(obs=obs, mask=mask)
+    def apply_action(self, action: int) -> Tuple[float, bool]:
+        """Executes a legal action for the current player, without asking its agent. Returns the reward and
+        whether the game is done. The turn is not passed on, call next_player for that."""
 
         # Initialize the reward
         reward = self.auto_reward_per_step
 
-        if mask[action]:
-            legal_actions = [c for c in range(len(mask)) if not mask[c]]
-            raise Exception("Something went wrong. An illegal action was chosen. Action taken:" + str(action)
-                            + ". Possible legal actions:" + str(legal_actions))
-
         if action != 0:
             # The gp where the player wants to build the village or build the street towards
             gi = math.floor((action - 1) / 2)
@@ -429,18 +549,55 @@ class Board:
                 raise Exception("A game cannot be ended by the losing player!")
             reward += self.winning_reward
 
-        next_obs = obs.copy() if action == 0 else np.array(self.get_obs(player=self.current_player))
+        return reward, done
+
+    def state_key(self) -> tuple:
+        """Returns a hashable key that is equal for boards in the same state"""
+        return (tuple(self.buildings), self.current_player_index, self.robber, self.resources.tobytes(),
+                tuple((p.street_mask, p.street_count, p.taken_mask) for p in self.players),
+                frozenset(self.connections.items()))
+
+    def step(self) -> Tuple[np.ndarray, Any, float, Union[np.ndarray, Any], bool, list, Any]:
+
+        # The mask and observation of the current player
+        mask = self.get_mask(player=self.current_player)
+        obs = self.get_obs(player=self.current_player)
+
+        # Let the current player choose an action
+        action, probs = self.current_player.choose_action(obs=obs, mask=mask)
+
+        if mask[action]:
+            legal_actions = [c for c in range(len(mask)) if not mask[c]]
+            raise Exception("Something went wrong. An illegal action was chosen. Action taken:" + str(action)
+                            + ". Possible legal actions:" + str(legal_actions))
+
+        if action != 0:
+            # The cached observation is about to be patched, keep a copy of the one the action was chosen on
+            np.copyto(self.obs_buffer, obs)
+            obs = self.obs_buffer
+
+        reward, done = self.apply_action(action=action)
+
+        # The observations are views of the board's buffers, they stay valid until the next step
+        next_obs = obs if action == 0 else self.get_obs(player=self.current_player)
 
         return obs, action, reward, next_obs, done, mask, probs
 
     def reset(self):
-        self.robber = 0
-        self.create_tgc()
+        self.robber = -1
+        self.occupied = 0
+        self.blocked = 0
+        self.buildings[:] = [0] * self.topology.gridpoint_count
+        self.open_neighbours[:] = self.topology.neighbour_masks
+        self.connections.clear()
+        self.robber_obs.fill(0.0)
+        self.production.fill(0)
+        self.undo_stack.clear()
         self.current_player_index = round(random.random())
         self.current_player = self.players[self.current_player_index]
+        self.version += 1
         for player in self.players:
             player.reset()
-        for gp in self.gridpoints:
-            gp.reset()
-        for tile in self.tiles:
-            tile.reset()
+            self.write_obs(player=player, out=player.obs)
+            player.dirty_gridpoints.clear()
+            player.obs_version = self.version
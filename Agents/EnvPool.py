@@ -0,0 +1,195 @@
+import ctypes
+import multiprocessing as mp
+import random
+import traceback
+from typing import Tuple
+
+import numpy as np
+
+from Board import Board
+from Topology import TOPOLOGY
+
+# Like ActorLearner, the workers are spawned: forking a process that has loaded TensorFlow is not safe
+CONTEXT = mp.get_context("spawn")
+
+
+def shared_array(shape: tuple, dtype, ctype) -> Tuple[mp.RawArray, np.ndarray]:
+    """Allocates shared memory and returns it together with a NumPy view of it"""
+    raw = CONTEXT.RawArray(ctype, int(np.prod(shape)))
+    return raw, np.frombuffer(raw, dtype=dtype).reshape(shape)
+
+
+def as_array(raw: mp.RawArray, shape: tuple, dtype) -> np.ndarray:
+    return np.frombuffer(raw, dtype=dtype).reshape(shape)
+
+
+class SharedBuffers:
+    """The arrays that the EnvPool and its workers exchange. Only the raw shared memory is pickled to the workers."""
+
+    # name: (per-env shape, dtype, ctype)
+    LAYOUT = {"obs": ((TOPOLOGY.obs_size,), np.float32, ctypes.c_float),
+              "masks": ((TOPOLOGY.action_count,), np.bool_, ctypes.c_bool),
+              "actions": ((), np.int64, ctypes.c_int64),
+              "rewards": ((), np.float64, ctypes.c_double),
+              "dones": ((), np.bool_, ctypes.c_bool),
+              "players": ((), np.int64, ctypes.c_int64),
+              "acted": ((), np.int64, ctypes.c_int64),
+              "winners": ((), np.int64, ctypes.c_int64)}
+
+    def __init__(self, num_envs: int, raw=None):
+        self.num_envs = num_envs
+        self.raw = {} if raw is None else raw
+        for name, (shape, dtype, ctype) in self.LAYOUT.items():
+            full_shape = (num_envs,) + shape
+            if raw is None:
+                self.raw[name], array = shared_array(shape=full_shape, dtype=dtype, ctype=ctype)
+            else:
+                array = as_array(raw=raw[name], shape=full_shape, dtype=dtype)
+            setattr(self, name, array)
+
+
+class Seat:
+    """Stands in for an agent in the boards of the workers, where it only gives its player an ID"""
+
+    def __init__(self, agent_id: int):
+        self.agent_id = agent_id
+
+
+def worker(conn, env_indexes: list, raw: dict, num_envs: int, player_ids: tuple, board_kwargs: dict, max_steps,
+           seed):
+    """Runs in a worker process and steps the boards of env_indexes on command of the EnvPool"""
+    random.seed(seed)
+    np.random.seed(seed)
+    buffers = SharedBuffers(num_envs=num_envs, raw=raw)
+    action_bits = np.arange(TOPOLOGY.action_count, dtype=np.int64)
+
+    # Actions come from the driver, so the players only need their IDs
+    boards = [Board(agent1=Seat(agent_id=player_ids[0]), agent2=Seat(agent_id=player_ids[1]), **board_kwargs)
+              for _ in env_indexes]
+    steps = [0] * len(env_indexes)
+    buffers.obs[env_indexes] = TOPOLOGY.obs_template
+
+    def write(i: int, board: Board):
+        """Writes the observation and mask of the player that is in turn"""
+        player = board.current_player
+        board.get_obs(player=player, out=buffers.obs[i])
+        buffers.masks[i] = ((board.get_mask_bits(player=player) >> action_bits) & 1) == 0
+        buffers.players[i] = board.current_player_index
+
+    def reset(k: int, i: int, board: Board):
+        board.reset()
+        steps[k] = 0
+        write(i=i, board=board)
+
+    while True:
+        command = conn.recv()
+        try:
+            if command == "reset":
+                for k, (i, board) in enumerate(zip(env_indexes, boards)):
+                    reset(k=k, i=i, board=board)
+            elif command == "step":
+                for k, (i, board) in enumerate(zip(env_indexes, boards)):
+                    action = int(buffers.actions[i])
+                    if buffers.masks[i, action]:
+                        raise Exception("An illegal action was chosen in env " + str(i) + ". Action taken:"
+                                        + str(action) + ". Possible legal actions:"
+                                        + str(board.legal_actions(board.current_player)))
+
+                    buffers.acted[i] = board.current_player_index
+                    reward, done = board.apply_action(action=action)
+                    steps[k] += 1
+                    winner = board.winner()
+                    buffers.winners[i] = -1 if winner is None else board.players.index(winner)
+
+                    if not done and max_steps is not None and steps[k] >= max_steps:
+                        done = True
+                    if not done and action == 0:
+                        board.next_player(step=steps[k])
+
+                    buffers.rewards[i] = reward
+                    buffers.dones[i] = done
+                    # Finished games are reset right away, the obs and mask are those of the next game
+                    if done:
+                        reset(k=k, i=i, board=board)
+                    else:
+                        write(i=i, board=board)
+            elif command == "close":
+                conn.send(None)
+                break
+            conn.send(None)
+        except Exception:
+            conn.send(traceback.format_exc())
+
+
+class EnvPool:
+    """Steps num_envs Boards spread over num_workers processes. Observations, masks, rewards and dones are exchanged
+    through shared memory, only the commands go through pipes. The returned arrays are views of the shared memory
+    and are overwritten by the next call."""
+
+    def __init__(self, num_envs: int, num_workers=None, max_steps=None, seed=0, player_ids=(1, 2), winning_reward=10,
+                 points_to_win=3, auto_reward_per_step=-0.01, losing_reward=-10):
+        if num_workers is None:
+            num_workers = CONTEXT.cpu_count()
+        num_workers = max(1, min(num_workers, num_envs))
+
+        self.num_envs = num_envs
+        self.num_workers = num_workers
+        self.max_steps = max_steps
+        self.player_ids = tuple(player_ids)
+        self.board_kwargs = dict(winning_reward=winning_reward, points_to_win=points_to_win,
+                                 auto_reward_per_step=auto_reward_per_step, losing_reward=losing_reward)
+        self.buffers = SharedBuffers(num_envs=num_envs)
+
+        self.connections = []
+        self.processes = []
+        for w, env_indexes in enumerate(np.array_split(np.arange(num_envs), num_workers)):
+            parent_conn, child_conn = CONTEXT.Pipe()
+            process = CONTEXT.Process(target=worker, daemon=True,
+                                      args=(child_conn, env_indexes.tolist(), self.buffers.raw, num_envs,
+                                            self.player_ids, self.board_kwargs, max_steps, seed + w))
+            process.start()
+            child_conn.close()
+            self.connections.append(parent_conn)
+            self.processes.append(process)
+
+    def command(self, command: str):
+        for conn in self.connections:
+            conn.send(command)
+        errors = [conn.recv() for conn in self.connections]
+        for error in errors:
+            if error is not None:
+                raise Exception("An EnvPool worker failed:\n" + error)
+
+    def reset(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Resets all boards and returns the observations and masks of the players in turn"""
+        self.command("reset")
+        return self.buffers.obs, self.buffers.masks
+
+    def step(self, actions) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Executes one action in every board and returns the next observations and masks and the rewards and dones.
+        After a pass the turn goes to the next player and finished games are reset. The index of the player that
+        acted, the winner (-1 if none) and the player in turn are in the acted, winners and players attributes."""
+        self.buffers.actions[:] = actions
+        self.command("step")
+        return self.buffers.obs, self.buffers.masks, self.buffers.rewards, self.buffers.dones
+
+    @property
+    def players(self) -> np.ndarray:
+        return self.buffers.players
+
+    @property
+    def acted(self) -> np.ndarray:
+        return self.buffers.acted
+
+    @property
+    def winners(self) -> np.ndarray:
+        return self.buffers.winners
+
+    def close(self):
+        for conn in self.connections:
+            conn.send("close")
+        for conn, process in zip(self.connections, self.processes):
+            conn.recv()
+            process.join()
+        self.connections.clear()
+        self.processes.clear()
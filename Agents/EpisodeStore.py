@@ -0,0 +1,127 @@
+import os
+from typing import Dict, Iterator, Tuple
+
+INDEX_NAME = "Index.txt"
+INDEX_HEADER = "Episode;Segment;Offset;Length"
+
+
+def segment_path(folder: str, segment: int) -> str:
+    return folder + "\\Segment" + str(segment) + ".txt"
+
+
+class EpisodeStore:
+    """Appends the logs of episodes to a few large segment files instead of a file per episode. One episode is
+    written at a time, straight to the current segment. When it ends, its segment, byte offset and length are
+    appended to the index, so an episode that was not ended (e.g. after a crash) is not in the index.
+    A new segment is started for the next episode once the current one is segment_size bytes or larger."""
+
+    def __init__(self, folder: str, segment_size=64 * 1024 * 1024):
+        self.folder = folder
+        self.segment_size = segment_size
+        if not os.path.exists(folder):
+            os.mkdir(path=folder)
+
+        self.index = load_index(folder=folder)
+        self.index_file = open(file=folder + "\\" + INDEX_NAME, mode='a')
+        if self.index_file.tell() == 0:
+            self.index_file.write(INDEX_HEADER + "\n")
+
+        self.segment = max([s for s, _, _ in self.index.values()], default=0)
+        self.segment_file = open(file=segment_path(folder=folder, segment=self.segment), mode='ab')
+        self.episode = None  # The episode that is being written
+        self.episode_offset = 0
+
+    def begin_episode(self, episode: int):
+        """Ends the episode that is being written and starts writing the given one"""
+        self.end_episode()
+        if episode in self.index:
+            raise Exception("Episode " + str(episode) + " is already in the store " + self.folder)
+
+        if self.segment_file.tell() >= self.segment_size:
+            self.segment_file.close()
+            self.segment += 1
+            self.segment_file = open(file=segment_path(folder=self.folder, segment=self.segment), mode='ab')
+        self.episode = episode
+        self.episode_offset = self.segment_file.tell()
+
+    def write(self, text: str):
+        if self.episode is None:
+            raise Exception("Begin an episode before writing to the store " + self.folder)
+        self.segment_file.write(text.encode())
+
+    def end_episode(self):
+        if self.episode is None:
+            return
+        length = self.segment_file.tell() - self.episode_offset
+        self.index[self.episode] = (self.segment, self.episode_offset, length)
+        self.index_file.write(str(self.episode) + ";" + str(self.segment) + ";" + str(self.episode_offset) + ";"
+                              + str(length) + "\n")
+        self.episode = None
+
+    def flush(self):
+        self.segment_file.flush()
+        self.index_file.flush()
+
+    def close(self):
+        self.end_episode()
+        self.segment_file.close()
+        self.index_file.close()
+
+
+def load_index(folder: str) -> Dict[int, Tuple[int, int, int]]:
+    """Returns the index of the store as {episode: (segment, offset, length)}"""
+    index = {}
+    path = folder + "\\" + INDEX_NAME
+    if not os.path.exists(path):
+        return index
+    with open(file=path, mode='r') as file:
+        for line in file:
+            if line.startswith("Episode") or len(line.strip()) == 0:
+                continue
+            episode, segment, offset, length = (int(x) for x in line.split(";"))
+            index[episode] = (segment, offset, length)
+    return index
+
+
+class EpisodeReader:
+    """Reads the episodes of an EpisodeStore, either one by one by their number or all in the order they are
+    stored. The segments are kept open, so close the reader when done."""
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.index = load_index(folder=folder)
+        self.segment_files = {}
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, episode: int) -> bool:
+        return episode in self.index
+
+    def episodes(self) -> list:
+        """The stored episodes, in the order they are stored"""
+        return sorted(self.index.keys(), key=lambda e: self.index[e][:2])
+
+    def read_bytes(self, episode: int) -> bytes:
+        if episode not in self.index:
+            raise Exception("Episode " + str(episode) + " is not in the store " + self.folder)
+        segment, offset, length = self.index[episode]
+        if segment not in self.segment_files:
+            self.segment_files[segment] = open(file=segment_path(folder=self.folder, segment=segment), mode='rb')
+        file = self.segment_files[segment]
+        file.seek(offset)
+        return file.read(length)
+
+    def read(self, episode: int) -> str:
+        """Returns the log of the episode, as the file of the episode would have been"""
+        return self.read_bytes(episode=episode).decode()
+
+    def __iter__(self) -> Iterator[Tuple[int, str]]:
+        """Yields (episode, log) for all episodes, reading every segment front to back"""
+        for episode in self.episodes():
+            yield episode, self.read(episode=episode)
+
+    def close(self):
+        for file in self.segment_files.values():
+            file.close()
+        self.segment_files = {}
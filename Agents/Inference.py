@@ -0,0 +1,99 @@
+from typing import Tuple
+
+import numpy as np
+
+
+def dense_layers(model) -> list:
+    """Returns the layers of a Keras model that have a kernel and a bias, in the order of the forward pass"""
+    return [layer for layer in model.layers if len(layer.get_weights()) == 2]
+
+
+def activation_name(layer) -> str:
+    activation = layer.activation
+    return activation if isinstance(activation, str) else activation.__name__
+
+
+class DenseStack:
+    """The float32 weights of a chain of dense layers, with one preallocated output buffer per layer"""
+
+    def __init__(self, layers: list, max_batch: int):
+        self.layers = layers
+        self.activations = [activation_name(layer) for layer in layers]
+        for activation in self.activations:
+            if activation not in ("relu", "softmax", "linear"):
+                raise Exception("Unsupported activation " + str(activation) + " in the inference engine!")
+        self.weights = []
+        self.biases = []
+        self.buffers = []
+        self.refresh()
+        self.buffers = [np.zeros((max_batch, w.shape[1]), dtype=np.float32) for w in self.weights]
+
+    def refresh(self):
+        weights = [layer.get_weights() for layer in self.layers]
+        self.weights = [np.ascontiguousarray(w, dtype=np.float32) for w, _ in weights]
+        self.biases = [np.ascontiguousarray(b, dtype=np.float32) for _, b in weights]
+
+    def forward(self, x: np.ndarray) -> np.ndarray:
+        """Evaluates the layers for a batch of at most max_batch rows, the result is a view of the last buffer"""
+        for w, b, activation, buffer in zip(self.weights, self.biases, self.activations, self.buffers):
+            out = buffer[:len(x)]
+            np.matmul(x, w, out=out)
+            out += b
+            if activation == "relu":
+                np.maximum(out, 0.0, out=out)
+            elif activation == "softmax":
+                out -= out.max(axis=1, keepdims=True)
+                np.exp(out, out=out)
+                out /= out.sum(axis=1, keepdims=True)
+            x = out
+        return x
+
+
+class MLPInference:
+    """Evaluates the actor and critic of an ActorCritic in NumPy, without going through TensorFlow. The layers
+    that the actor and critic share are evaluated once. Call refresh after the Keras models were trained."""
+
+    def __init__(self, actor, critic=None, max_batch=64):
+        self.max_batch = max_batch
+        actor_layers = dense_layers(actor)
+        critic_layers = [] if critic is None else dense_layers(critic)
+
+        shared = 0
+        while shared < min(len(actor_layers), len(critic_layers)) and actor_layers[shared] is critic_layers[shared]:
+            shared += 1
+
+        self.trunk = DenseStack(layers=actor_layers[:shared], max_batch=max_batch)
+        self.policy_head = DenseStack(layers=actor_layers[shared:], max_batch=max_batch)
+        self.value_head = DenseStack(layers=critic_layers[shared:], max_batch=max_batch) if critic is not None \
+            else None
+        self.input = np.zeros((max_batch, actor_layers[0].get_weights()[0].shape[0]), dtype=np.float32)
+
+    def refresh(self):
+        self.trunk.refresh()
+        self.policy_head.refresh()
+        if self.value_head is not None:
+            self.value_head.refresh()
+
+    def features(self, states: np.ndarray) -> np.ndarray:
+        x = self.input[:len(states)]
+        x[:] = states
+        return self.trunk.forward(x)
+
+    def predict(self, states: np.ndarray) -> np.ndarray:
+        """Returns the action probabilities of the states. Larger batches than max_batch are evaluated in parts.
+        The result is a view of the engine's buffers if it fits in one batch, copy it to keep it."""
+        if len(states) > self.max_batch:
+            return np.concatenate([np.array(self.predict(states[i:i + self.max_batch]))
+                                   for i in range(0, len(states), self.max_batch)])
+        return self.policy_head.forward(self.features(states))
+
+    def evaluate(self, states: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the action probabilities and the values of the states in one pass through the shared layers"""
+        if self.value_head is None:
+            raise Exception("The inference engine has no critic to evaluate the values with!")
+        if len(states) > self.max_batch:
+            probabilities, values = zip(*[tuple(np.array(x) for x in self.evaluate(states[i:i + self.max_batch]))
+                                          for i in range(0, len(states), self.max_batch)])
+            return np.concatenate(probabilities), np.concatenate(values)
+        features = self.features(states)
+        return self.policy_head.forward(features), self.value_head.forward(features)[:, 0]
@@ -0,0 +1,188 @@
+import itertools
+import math
+import multiprocessing as mp
+import os
+from functools import partial
+from typing import Dict, Iterator, List
+
+import numpy as np
+
+import StepLog
+from EpisodeStore import EpisodeReader
+from Topology import TOPOLOGY
+
+CONTEXT = mp.get_context("spawn")
+
+
+def run_path(run_id) -> str:
+    """The folder the Logger writes the logs of a run to"""
+    return "Logs\\Run " + str(run_id)
+
+
+def run_log_path(folder: str) -> str:
+    """The RunN.txt in the folder of run N"""
+    return folder + "\\" + folder.split("\\")[-1].replace(" ", "") + ".txt"
+
+
+def read_run_log(folder: str, chunk_size=10000, sep=";") -> Iterator[Dict[str, np.ndarray]]:
+    """Yields the RunN.txt of the run in the folder as {column: float64 array}, chunk_size episodes at a time.
+    A last line that was not completely written is skipped."""
+    with open(file=run_log_path(folder=folder), mode='r') as file:
+        header = file.readline().rstrip("\n").split(sep)
+        while True:
+            lines = list(itertools.islice(file, chunk_size))
+            if len(lines) == 0:
+                return
+            rows = [line.rstrip("\n").split(sep) for line in lines]
+            rows = [row for row in rows if len(row) == len(header)]
+            values = np.array(rows, dtype=np.float64).reshape(len(rows), len(header))
+            yield {name: values[:, i] for i, name in enumerate(header)}
+
+
+def parse_steps(episodes: list, lines: list, sep=";") -> Dict[str, np.ndarray]:
+    """Parses the lines of text step logs into the columns of StepLog"""
+    fields = [line.rstrip("\n").split(sep, 6) for line in lines]
+    columns = {"time": np.array([f[0] for f in fields], dtype=np.float64),
+               "episode": np.array(episodes, dtype=np.int32),
+               "step": np.array([f[1] for f in fields], dtype=np.int32),
+               "player": np.array([f[2] for f in fields], dtype=np.int8),
+               "action": np.array([f[3] for f in fields], dtype=np.int8),
+               "points": np.array([f[5] for f in fields], dtype=np.float32)}
+
+    resources = ",".join(f[4].strip("[]") for f in fields)
+    columns["resources"] = np.array(resources.split(",") if len(fields) > 0 else [],
+                                    dtype=np.int16).reshape(len(fields), 3)
+
+    probs = np.full((len(fields), TOPOLOGY.action_count), np.nan, dtype=np.float16)
+    for i, f in enumerate(fields):
+        if f[6] != "None":
+            probs[i] = np.array(f[6].strip("[]").split(","), dtype=np.float64)
+    columns["probs"] = probs
+    return {name: columns[name] for name, _, _ in StepLog.COLUMNS}
+
+
+def read_steps(folder: str, chunk_size=10000, sep=";") -> Iterator[Dict[str, np.ndarray]]:
+    """Yields the step logs of the run in the folder with the columns of StepLog, about chunk_size steps at a time.
+    Reads the binary step log if the run has one, otherwise the text logs in the episode store."""
+    binary_path = folder + "\\Steps.bin"
+    if os.path.exists(binary_path):
+        yield from StepLog.iter_chunks(path=binary_path)
+        return
+
+    reader = EpisodeReader(folder=folder + "\\Episodes")
+    try:
+        episodes = []
+        lines = []
+        for episode, text in reader:
+            for line in text.splitlines():
+                if not line.startswith("Time"):
+                    episodes.append(episode)
+                    lines.append(line)
+            if len(lines) >= chunk_size:
+                yield parse_steps(episodes=episodes, lines=lines, sep=sep)
+                episodes = []
+                lines = []
+        if len(lines) > 0:
+            yield parse_steps(episodes=episodes, lines=lines, sep=sep)
+    finally:
+        reader.close()
+
+
+class WindowedMean:
+    """Turns a series that arrives in chunks into the mean of the last window values at every point, keeping only
+    the last window - 1 values between chunks. NaN values (e.g. the loss in an episode without an update) are left
+    out of the mean. Before the window is full it is the mean of all values so far, and NaN without any values."""
+
+    def __init__(self, window: int):
+        self.window = window
+        self.tail = np.zeros(0, dtype=np.float64)
+
+    def update(self, x: np.ndarray) -> np.ndarray:
+        values = np.concatenate((self.tail, np.asarray(x, dtype=np.float64)))
+        present = ~np.isnan(values)
+        sums = np.cumsum(np.concatenate(([0.0], np.where(present, values, 0.0))))
+        counts = np.cumsum(np.concatenate(([0], present)))
+        ends = np.arange(len(self.tail) + 1, len(values) + 1)
+        starts = np.maximum(ends - self.window, 0)
+        filled = counts[ends] - counts[starts]
+        self.tail = values[-(self.window - 1):] if self.window > 1 else values[:0]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(filled > 0, (sums[ends] - sums[starts]) / filled, np.nan)
+
+
+class IntHistogram:
+    """Counts non-negative integers, e.g. step counts, to get their percentiles without keeping them"""
+
+    def __init__(self):
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def update(self, x: np.ndarray):
+        counts = np.bincount(np.asarray(x, dtype=np.int64), minlength=len(self.counts))
+        counts[:len(self.counts)] += self.counts
+        self.counts = counts
+
+    def percentiles(self, percentiles) -> Dict[float, int]:
+        cumulative = np.cumsum(self.counts)
+        total = cumulative[-1] if len(cumulative) > 0 else 0
+        if total == 0:
+            return {p: 0 for p in percentiles}
+        # The smallest value that at least p percent of the values are smaller than or equal to
+        return {p: int(np.searchsorted(cumulative, max(1, math.ceil(p / 100 * total)))) for p in percentiles}
+
+
+def is_win_column(name: str) -> bool:
+    return name.startswith("Wins") and not name.endswith(("-RA", "-SA"))
+
+
+def is_loss_column(name: str) -> bool:
+    return "Loss" in name and not name.endswith(("-RA", "-SA"))
+
+
+def analyze_run(folder: str, windows=(100, 1000), percentiles=(5, 25, 50, 75, 95), chunk_size=10000,
+                sep=";") -> dict:
+    """Reads the RunN.txt of the run once and returns the win rate and loss curves of every player per window
+    (one value per episode), and the mean, minimum, maximum and percentiles of the steps per episode"""
+    win_curves = {}
+    loss_curves = {}
+    means = {}
+    steps = IntHistogram()
+    episodes = 0
+    for chunk in read_run_log(folder=folder, chunk_size=chunk_size, sep=sep):
+        episodes += len(chunk["Episode"])
+        steps.update(chunk["Steps"])
+        for name, values in chunk.items():
+            curves = win_curves if is_win_column(name) else loss_curves if is_loss_column(name) else None
+            if curves is None:
+                continue
+            for window in windows:
+                if (name, window) not in means:
+                    means[name, window] = WindowedMean(window=window)
+                curves.setdefault(name, {}).setdefault(window, []).append(means[name, window].update(values))
+
+    def concatenate(curves: dict) -> dict:
+        return {name: {window: np.concatenate(parts) for window, parts in per_window.items()}
+                for name, per_window in curves.items()}
+
+    values = np.arange(len(steps.counts))
+    total = int(steps.counts.sum())
+    used = values[steps.counts > 0]
+    return {"folder": folder,
+            "episodes": episodes,
+            "win_rate": concatenate(win_curves),
+            "losses": concatenate(loss_curves),
+            "steps": {"mean": float((values * steps.counts).sum() / total) if total > 0 else 0.0,
+                      "min": int(used[0]) if len(used) > 0 else 0,
+                      "max": int(used[-1]) if len(used) > 0 else 0,
+                      "percentiles": steps.percentiles(percentiles=percentiles)}}
+
+
+def analyze_runs(folders: List[str], processes=None, **kwargs) -> List[dict]:
+    """Analyzes the runs in parallel, one run per process at a time. The keyword arguments go to analyze_run."""
+    if len(folders) == 0:
+        return []
+    if processes is None:
+        processes = min(len(folders), CONTEXT.cpu_count())
+    if processes <= 1:
+        return [analyze_run(folder=folder, **kwargs) for folder in folders]
+    with CONTEXT.Pool(processes=processes) as pool:
+        return pool.map(partial(analyze_run, **kwargs), folders)
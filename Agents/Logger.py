@@ -1,28 +1,49 @@
+import itertools
+import math
 import os
+import queue
+import threading
 import time
 
 from typing import List
 
 import Board
 import Agents
+import StepLog
+from EpisodeStore import EpisodeStore
+from Statistics import RunningStat
 
-
-def sliding_avg(x: list, window=1000, soft=True):
-    if len(x) < window:
-        if soft:
-            return sum(x) / len(x)
-        else:
-            return sum(x) / window
-    else:
-        return sum(x[-window:]) / window
+# The formats the step logs can be written in
+TEXT = "text"  # Text, in the segments of an EpisodeStore
+BINARY = "binary"  # One columnar binary file (see StepLog) for the whole run
 
 
 class Logger:
-    def __init__(self, run_id, sliding_window_size=1000):
+    def __init__(self, run_id, sliding_window_size=1000, background=True, flush_interval=1.0, queue_size=10000,
+                 step_format=TEXT, compress=True):
+        if step_format not in (TEXT, BINARY):
+            raise Exception("Unknown step log format " + str(step_format) + ", expected " + TEXT + " or " + BINARY)
         self.run_id = run_id
         self.log_path = "Logs\\Run " + str(run_id)
         self.prepare_dirs()
-        self.sliding_window_size = sliding_window_size
+        self.sliding_window_size = sliding_window_size  # The window of the sliding means (-SA) of all stats
+        # Per player and stat, how many values the stat had at the last write_episode
+        self.written_counts = {}
+
+        # The step logs are written by a background thread, unless background is False.
+        # Call close at the end of the run to write everything that is still queued.
+        self.flush_interval = flush_interval  # The maximum number of seconds a written step stays in the buffer
+        self.step_log = None  # The EpisodeStore the text steps are written to, opened at the first step
+        # In the binary format the steps are written in chunks, so the last steps are only on disk after close
+        self.binary_step_log = None
+        if step_format == BINARY:
+            self.binary_step_log = StepLog.BinaryStepLog(path=self.log_path + "\\Steps.bin", compress=compress)
+        self.step_queue = queue.Queue(maxsize=queue_size)
+        self.writer_error = None
+        self.writer = None
+        if background:
+            self.writer = threading.Thread(target=self.run_writer, name="Step log writer " + str(run_id), daemon=True)
+            self.writer.start()
 
     def prepare_dirs(self):
         # log_dir = "Logs\\" + str(self.run_id)
@@ -34,7 +55,10 @@ class Logger:
         else:
             os.mkdir(self.log_path)
 
-    def write_episode(self, episode: int, steps: list, spi: int, players: List[Board.Player], sep=";"):
+    def write_episode(self, episode: int, steps: RunningStat, spi: int, players: List[Board.Player], sep=";"):
+        """Writes the last value, the mean (-RA) and the sliding mean (-SA) of the steps and of the stats of every
+        player. A stat that got no value this episode, like the loss of an agent that did not update, gets NaN as
+        its last value, and NaN everywhere until it has one."""
         log_name = self.log_path + "\\" + "Run" + str(self.run_id) + ".txt"
         log = open(file=log_name, mode='a')
         if os.stat(path=log_name).st_size == 0:
@@ -48,44 +72,120 @@ class Logger:
 
             log.write(initial_string + "\n")
 
+        for stat in [steps] + [stat for player in players for stat in player.get_stats()]:
+            if stat.window != self.sliding_window_size:
+                stat.set_window(window=self.sliding_window_size)
+
         string = str(time.time()) + sep + str(episode) + sep + str(spi) + sep \
-                 + str(steps[-1]) + sep + str(sum(steps) / (episode + 1)) + sep \
-                 + str(sliding_avg(steps, window=self.sliding_window_size))
+                 + str(steps.last) + sep + str(steps.mean) + sep + str(steps.sliding_mean)
 
         for player in players:
-            for stat in player.get_stats():
-                string += sep + str(stat[-1]) + sep + str(sum(stat) / (episode + 1)) + sep \
-                          + str(sliding_avg(stat, window=self.sliding_window_size))
+            for index, stat in enumerate(player.get_stats()):
+                key = (player.ID, index)
+                if len(stat) == 0:
+                    string += (sep + "nan") * 3
+                    continue
+                last = stat.last if len(stat) > self.written_counts.get(key, 0) else math.nan
+                self.written_counts[key] = len(stat)
+                string += sep + str(last) + sep + str(stat.mean) + sep + str(stat.sliding_mean)
 
         log.write(string + "\n")
         log.close()
 
     def write_step(self, episode: int, step: int, current_player: int, action: int, resources: list, points: float,
                    sep=";", probs=None):
-
-        # Check whether the subfolder of the run for episodes exists
-        episode_logs_folder_path = self.log_path + "\\Episodes"
-        if not os.path.exists(episode_logs_folder_path):
-            os.mkdir(path=episode_logs_folder_path)
-
-        # The path to the actual log
-        new_path = episode_logs_folder_path + "\\" + str(episode) + ".txt"
-        log = open(file=new_path, mode='a')
-        if os.stat(path=new_path).st_size == 0:
+        """Queues a step for the episode log. The resources and probs are copied, so they may be changed after."""
+        self.check_writer()
+        record = (time.time(), episode, step, current_player, action, [int(r) for r in resources], points,
+                  None if probs is None else [float(p) for p in probs], sep)
+        if self.writer is None:
+            self.write_steps(records=[record])
+        else:
+            # Blocks when the writer is too far behind
+            self.step_queue.put(record)
+
+    def write_steps(self, records: list):
+        """Formats the step records and writes them to the episode store, or appends them to the binary step log"""
+        if self.binary_step_log is not None:
+            for t, episode, step, current_player, action, resources, points, probs, _ in records:
+                self.binary_step_log.append(t=t, episode=episode, step=step, player=current_player, action=action,
+                                            resources=resources, points=points, probs=probs)
+            return
+
+        for episode, group in itertools.groupby(records, key=lambda r: r[1]):
+            group = list(group)
+            log = self.episode_log(episode=episode, sep=group[0][-1])
+            lines = []
+            for t, _, step, current_player, action, resources, points, probs, sep in group:
+                lines.append(str(t) + sep + str(step) + sep + str(current_player) + sep + str(action)
+                             + sep + str(resources) + sep + str(points) + sep
+                             + ("None" if probs is None else str(probs)) + "\n")
+            log.write("".join(lines))
+
+    def episode_log(self, episode: int, sep: str) -> EpisodeStore:
+        """Returns the episode store, with the given episode being written. The previous episode is ended."""
+        if self.step_log is None:
+            self.step_log = EpisodeStore(folder=self.log_path + "\\Episodes")
+        if self.step_log.episode != episode:
+            self.step_log.begin_episode(episode=episode)
             initial_string = "Time" + sep + "Step" + sep + "CurrentPlayer" \
                              + sep + "Action" + sep + "Resources" + sep + "Points" + sep + "Probs"
-            log.write(initial_string + "\n")
-
-        string = str(time.time()) + sep + str(step) + sep + str(current_player) + sep + str(action) \
-                 + sep + str(resources) + sep + str(points)
-
-        if probs is None:
-            string += sep + "None"
-        else:
-            string += sep + str(list(probs))
-
-        log.write(string + "\n")
-        log.close()
+            self.step_log.write(initial_string + "\n")
+        return self.step_log
+
+    def run_writer(self):
+        """Writes the queued steps in batches and flushes them every flush_interval seconds, until close"""
+        running = True
+        try:
+            last_flush = time.time()
+            while running:
+                records = []
+                try:
+                    records.append(self.step_queue.get(timeout=self.flush_interval))
+                    # Take everything else that is waiting, so it is formatted and written at once
+                    while len(records) < self.step_queue.maxsize:
+                        records.append(self.step_queue.get_nowait())
+                except queue.Empty:
+                    pass
+
+                if len(records) > 0 and records[-1] is None:
+                    running = False
+                    records.pop()
+                if len(records) > 0:
+                    self.write_steps(records=records)
+
+                if not running or time.time() - last_flush >= self.flush_interval:
+                    self.flush_steps()
+                    last_flush = time.time()
+        except Exception as e:
+            self.writer_error = e
+            # Keep emptying the queue until close, so write_step and close do not block
+            while running and self.step_queue.get() is not None:
+                pass
+
+    def flush_steps(self):
+        if self.step_log is not None:
+            self.step_log.flush()
+        if self.binary_step_log is not None:
+            self.binary_step_log.flush()
+
+    def check_writer(self):
+        if self.writer_error is not None:
+            raise Exception("The step log writer of run " + str(self.run_id) + " failed!") from self.writer_error
+
+    def close(self):
+        """Writes all queued steps and closes the logs"""
+        if self.writer is not None:
+            self.step_queue.put(None)
+            self.writer.join()
+            self.writer = None
+        if self.step_log is not None:
+            self.step_log.close()
+            self.step_log = None
+        if self.binary_step_log is not None:
+            self.binary_step_log.close()
+            self.binary_step_log = None
+        self.check_writer()
 
     def write_config(self, run_id: int, max_episodes: int, max_steps: int, env: Board.Board,
                      agents: List[Agents.Agent]):
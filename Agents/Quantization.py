@@ -0,0 +1,29 @@
+import numpy as np
+
+from Topology import TOPOLOGY
+
+# The largest amount of a resource that fits in a code
+MAX_RESOURCES = 255
+
+
+def encode(obs: np.ndarray, out=None) -> np.ndarray:
+    """Packs one or more observations into uint8 codes, using the scale and offset tables of the topology"""
+    obs = np.asarray(obs)
+    resources = obs[..., :3]
+    if resources.max(initial=0) > MAX_RESOURCES or resources.min(initial=0) < 0:
+        raise Exception("The resources " + str(resources.tolist()) + " do not fit in an uint8 observation!")
+
+    codes = np.rint(obs * TOPOLOGY.obs_scale + TOPOLOGY.obs_offset)
+    if out is None:
+        return codes.astype(np.uint8)
+    out[...] = codes
+    return out
+
+
+def decode(codes: np.ndarray, out=None) -> np.ndarray:
+    """Unpacks uint8 codes into float32 observations"""
+    if out is None:
+        out = np.empty(codes.shape, dtype=np.float32)
+    np.subtract(codes, TOPOLOGY.obs_offset, out=out)
+    out /= TOPOLOGY.obs_scale
+    return out
@@ -0,0 +1,87 @@
+import numpy as np
+
+
+def episode_ends(rewards, dones=None) -> np.ndarray:
+    """Returns the dones as a bool array. Without dones, the rewards are one episode that ends at the last step."""
+    if dones is None:
+        dones = np.zeros(len(rewards), dtype=bool)
+        if len(dones) > 0:
+            dones[-1] = True
+        return dones
+    dones = np.asarray(dones, dtype=bool)
+    if len(dones) != len(rewards):
+        raise Exception("The number of dones (" + str(len(dones)) + ") does not match the number of rewards ("
+                        + str(len(rewards)) + ")!")
+    return dones
+
+
+def reverse_scan(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Solves x[t] = b[t] + a[t] * x[t + 1] (with x after the last step being 0) for all t at once, by doubling
+    the reach of every element in log2(len) vectorized steps instead of looping over the steps"""
+    x = np.array(b[::-1], dtype=np.float64)
+    a = np.array(a[::-1], dtype=np.float64)
+    # Reversed, x[i] = b[i] + a[i] * x[i - 1]
+    k = 1
+    while k < len(x):
+        x[k:] = x[k:] + a[k:] * x[:-k]
+        a[k:] = a[k:] * a[:-k]
+        k *= 2
+    return x[::-1]
+
+
+def discounted_returns(rewards, dones=None, discount_factor=0.99) -> np.ndarray:
+    """Returns the gamma-discounted returns of a batch of one or more episodes. The sum is reset after every
+    step that is done, so the episodes can be concatenated."""
+    dones = episode_ends(rewards=rewards, dones=dones)
+    return reverse_scan(a=discount_factor * ~dones, b=np.asarray(rewards, dtype=np.float64))
+
+
+def n_step_targets(rewards, values, dones=None, discount_factor=0.99, n=5) -> np.ndarray:
+    """Returns the n-step targets: the discounted rewards of the next n steps plus the discounted value of the
+    state after them. Targets stop at the end of an episode, and at the end of the batch they get no value."""
+    rewards = np.asarray(rewards, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    dones = episode_ends(rewards=rewards, dones=dones)
+    length = len(rewards)
+
+    targets = np.zeros(length, dtype=np.float64)
+    alive = np.ones(length, dtype=bool)  # If the episode of step t is still going at step t + k
+    discount = 1.0
+    steps = np.arange(length)
+    for k in range(n):
+        index = steps + k
+        alive &= index < length
+        index = np.minimum(index, length - 1)
+        targets += np.where(alive, discount * rewards[index], 0.0)
+        alive &= ~dones[index]
+        discount *= discount_factor
+
+    index = steps + n
+    alive &= index < length
+    targets += np.where(alive, discount * values[np.minimum(index, length - 1)], 0.0)
+    return targets
+
+
+def gae(rewards, values, dones=None, discount_factor=0.99, lam=0.95, last_value=0.0) -> np.ndarray:
+    """Returns the generalized advantage estimates. last_value is the value of the state after the batch, if the
+    last episode is not done."""
+    rewards = np.asarray(rewards, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    dones = episode_ends(rewards=rewards, dones=dones)
+
+    next_values = np.append(values[1:], last_value)
+    deltas = rewards + discount_factor * next_values * ~dones - values
+    return reverse_scan(a=discount_factor * lam * ~dones, b=deltas)
+
+
+def normalize(x: np.ndarray) -> np.ndarray:
+    """Returns x with a mean of 0 and a standard deviation of 1. A NaN or 0 standard deviation is left at 1."""
+    x = np.asarray(x, dtype=np.float64)
+    if len(x) == 0:
+        return x
+    mean = np.mean(x)
+    x = x - (mean if not np.isnan(mean) else 0.0)
+    std = np.std(x)
+    if np.isnan(std) or std == 0:
+        std = 1.0
+    return x / std
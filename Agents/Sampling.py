@@ -0,0 +1,78 @@
+import numpy as np
+
+# The ways an action can be sampled from the probabilities
+GUMBEL = "gumbel"
+CDF = "cdf"
+
+
+def as_batch(x, dtype) -> np.ndarray:
+    """Returns x as a 2D array, a single row becomes a batch of one"""
+    x = np.asarray(x, dtype=dtype)
+    return x[np.newaxis, :] if x.ndim == 1 else x
+
+
+def apply_mask(probs, masks) -> np.ndarray:
+    """Returns a float64 copy of the (B, A) probabilities where the illegal (True in the mask), NaN and negative
+    entries are 0.0"""
+    probs = np.array(as_batch(probs, dtype=np.float64))
+    masks = as_batch(masks, dtype=bool)
+    if probs.shape != masks.shape:
+        raise Exception("The shape of the probabilities " + str(probs.shape) + " and the mask " + str(masks.shape)
+                        + " do no match!")
+    probs[masks | ~(probs > 0.0)] = 0.0
+    return probs
+
+
+def normalize_rows(probs: np.ndarray) -> np.ndarray:
+    """Divides every row by its sum in place. Rows that sum to 0.0 are left as they are."""
+    totals = probs.sum(axis=1, keepdims=True)
+    np.divide(probs, totals, out=probs, where=totals > 0.0)
+    return probs
+
+
+def masked_probabilities(probs, masks) -> np.ndarray:
+    """Returns the probabilities of the legal actions, normalized per row. Rows without any probability on a legal
+    action fall back to a uniform distribution over the legal actions."""
+    masks = as_batch(masks, dtype=bool)
+    probs = apply_mask(probs=probs, masks=masks)
+    legal = ~masks
+    if not legal.any(axis=1).all():
+        raise Exception("Cannot choose an action, there are no legal actions in rows "
+                        + str(np.flatnonzero(~legal.any(axis=1)).tolist()))
+
+    empty = probs.sum(axis=1) <= 0.0
+    if empty.any():
+        probs[empty] = legal[empty]
+    return normalize_rows(probs)
+
+
+def sample(probs, masks, method=GUMBEL, rng=np.random) -> np.ndarray:
+    """Samples one legal action per row of the (B, A) probabilities and masks and returns the (B,) action indexes.
+    rng is np.random or a np.random.RandomState."""
+    probs = masked_probabilities(probs=probs, masks=masks)
+
+    if method == GUMBEL:
+        # The argmax of the log-probabilities plus Gumbel noise is distributed like the probabilities.
+        # Illegal actions have a log-probability of -inf, so they are never chosen.
+        with np.errstate(divide="ignore"):
+            scores = np.log(probs)
+        scores -= np.log(-np.log(1.0 - rng.random_sample(probs.shape)))
+        return scores.argmax(axis=1)
+    elif method == CDF:
+        # u is in (0, 1], so the first entry of the cumulative sum that reaches it always has a probability > 0
+        cumulative = np.cumsum(probs, axis=1)
+        u = (1.0 - rng.random_sample((len(probs), 1))) * cumulative[:, -1:]
+        return (cumulative < u).sum(axis=1)
+    else:
+        raise Exception("Unknown sampling method " + str(method) + ", expected " + GUMBEL + " or " + CDF)
+
+
+def sample_legal(masks, rng=np.random) -> np.ndarray:
+    """Samples one action per row uniformly from the legal actions of the (B, A) masks"""
+    masks = as_batch(masks, dtype=bool)
+    if not (~masks).any(axis=1).all():
+        raise Exception("Cannot choose an action, there are no legal actions in rows "
+                        + str(np.flatnonzero(masks.all(axis=1)).tolist()))
+    scores = rng.random_sample(masks.shape)
+    scores[masks] = -1.0
+    return scores.argmax(axis=1)
@@ -2,11 +2,12 @@ import time
 import Agents
 from Board import Board
 from Logger import Logger as Logger
+from Statistics import RunningStat
 
 action_shape = (49,)
 obs_shape = (147,)
 
-averages = []
+averages = RunningStat()
 
 runs = [108]
 
@@ -21,7 +22,7 @@ for run_id in runs:
     episode_log_frequency = 1  # Per how many episode a whole episode should be logged
 
     total_time = 0
-    steps_list = []
+    steps_list = RunningStat()
     total_turns = 0
 
     logger = Logger(run_id=run_id)
@@ -63,19 +64,19 @@ for run_id in runs:
                         player.agent.rewards[-1] += env.losing_reward
 
                     player.agent.r_wins.append(int(player == winner))
-                    player.agent.r_rewards.append(sum(player.agent.rewards))
+                    player.agent.r_rewards.append(float(player.agent.rewards.sum()))
 
             if episode % episode_log_frequency == 0:
                 logger.write_step(episode=episode, step=steps, current_player=env.current_player.ID, action=action,
-                                  resources=env.current_player.resources, points=sum(env.current_player.agent.rewards),
-                                  probs=probs)
+                                  resources=env.current_player.resources,
+                                  points=float(env.current_player.agent.rewards.sum()), probs=probs)
 
             if action == 0:
                 env.next_player(steps)
 
         duration = round(time.time() - start_time, 2)
         print("Episode", episode, "of run", str(run_id), "done in", duration, "sec. and", steps, "steps. Result:",
-              str([(p.ID, round(p.agent.r_rewards[-1], 2)) for p in env.players]))
+              str([(p.ID, round(p.agent.r_rewards.last, 2)) for p in env.players]))
         total_time += duration
         steps_list.append(steps)
 
@@ -92,10 +93,11 @@ for run_id in runs:
             #print("Average steps between resources for player " + str(player.ID) + " is " + str(sum(deltas) / len(deltas)))
             averages.append(sum(deltas) / len(deltas))
 
+    logger.close()
 
-    print("Average steps between resources = " + str(sum(averages) / len(averages)))
+    print("Average steps between resources = " + str(averages.mean))
     print("Completed run", run_id, "with ", max_episodes, "episodes.  Elapsed :", str(round(total_time)),
-          "sec. (avg", str(round(total_time / max_episodes, 3)), "p.e.). Total steps:", sum(steps_list), "(avg",
-          str(round(sum(steps_list) / max_episodes)), "p.e.). Turns:", total_turns, "/", str(total_turns / 2),
+          "sec. (avg", str(round(total_time / max_episodes, 3)), "p.e.). Total steps:", round(steps_list.total), "(avg",
+          str(round(steps_list.total / max_episodes)), "p.e.). Turns:", total_turns, "/", str(total_turns / 2),
           "Rounds (avg",
           str(round(total_turns / max_episodes, 3)), "p.e.)")
@@ -0,0 +1,65 @@
+import numpy as np
+
+
+class RunningStat:
+    """Keeps the statistics of a metric that gets one value per episode (or update) in constant time and space:
+    the last value, the cumulative total and mean, and the mean of the last window values. The window is a ring
+    buffer with a running sum, which is summed again every time the buffer wraps around so rounding errors
+    do not add up over long runs."""
+
+    def __init__(self, window=1000):
+        if window < 1:
+            raise Exception("The window of a running stat should be at least 1, got " + str(window))
+        self.window = window
+        self.count = 0
+        self.last_value = None  # As it was appended, so e.g. ints are logged without decimals
+        self.total = 0.0
+        self.buffer = np.zeros(window, dtype=np.float64)
+        self.position = 0  # Where the next value goes in the buffer
+        self.filled = 0  # How many values are in the buffer
+        self.window_sum = 0.0
+
+    def append(self, value: float):
+        self.last_value = value
+        value = float(value)
+        self.count += 1
+        self.total += value
+        self.window_sum += value - self.buffer[self.position]
+        self.buffer[self.position] = value
+        self.filled = min(self.filled + 1, self.window)
+        self.position += 1
+        if self.position == self.window:
+            self.position = 0
+            self.window_sum = float(self.buffer.sum())
+
+    def set_window(self, window: int):
+        """Changes the size of the sliding window, keeping the values that still fit in it"""
+        if window < 1:
+            raise Exception("The window of a running stat should be at least 1, got " + str(window))
+        # The stored values from oldest to newest
+        values = np.roll(self.buffer, -self.position)[self.window - self.filled:][-window:]
+        self.window = window
+        self.buffer = np.zeros(window, dtype=np.float64)
+        self.buffer[:len(values)] = values
+        self.position = len(values) % window
+        self.filled = len(values)
+        self.window_sum = float(values.sum())
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def last(self) -> float:
+        if self.count == 0:
+            raise Exception("The running stat does not have any values yet!")
+        return self.last_value
+
+    @property
+    def mean(self) -> float:
+        """The mean of all values"""
+        return self.total / self.count if self.count > 0 else 0.0
+
+    @property
+    def sliding_mean(self) -> float:
+        """The mean of the last window values, or of all values in the window if there are fewer"""
+        return self.window_sum / self.filled if self.filled > 0 else 0.0
@@ -0,0 +1,113 @@
+import struct
+import zlib
+from typing import Dict, Iterator
+
+import numpy as np
+
+from Topology import TOPOLOGY
+
+MAGIC = b"CBSTEPS1"
+# Per chunk: the number of rows, the number of bytes that follow and whether they are compressed
+CHUNK_HEADER = struct.Struct("<IIB")
+
+# The columns of a step, as (name, dtype, shape of one row). The probs of a step without probs are NaN.
+COLUMNS = (("time", np.float64, ()),
+           ("episode", np.int32, ()),
+           ("step", np.int32, ()),
+           ("player", np.int8, ()),
+           ("action", np.int8, ()),
+           ("resources", np.int16, (3,)),
+           ("points", np.float32, ()),
+           ("probs", np.float16, (TOPOLOGY.action_count,)))
+
+
+class BinaryStepLog:
+    """Writes steps to a columnar binary file. The steps are collected in preallocated column arrays and every
+    chunk_size steps the columns are written one after the other, optionally zlib-compressed. Read the file back
+    with load or iter_chunks."""
+
+    def __init__(self, path: str, chunk_size=4096, compress=True, compression_level=6):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.compress = compress
+        self.compression_level = compression_level
+        self.columns = {name: np.zeros((chunk_size,) + shape, dtype=dtype) for name, dtype, shape in COLUMNS}
+        self.rows = 0
+        self.file = open(file=path, mode='ab')
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+
+    def append(self, t: float, episode: int, step: int, player: int, action: int, resources, points: float,
+               probs=None):
+        i = self.rows
+        columns = self.columns
+        columns["time"][i] = t
+        columns["episode"][i] = episode
+        columns["step"][i] = step
+        columns["player"][i] = player
+        columns["action"][i] = action
+        columns["resources"][i] = resources
+        columns["points"][i] = points
+        if probs is None:
+            columns["probs"][i] = np.nan
+        elif len(probs) != TOPOLOGY.action_count:
+            raise Exception("Expected " + str(TOPOLOGY.action_count) + " probs in the step log, got " + str(len(probs)))
+        else:
+            columns["probs"][i] = probs
+
+        self.rows += 1
+        if self.rows == self.chunk_size:
+            self.write_chunk()
+
+    def write_chunk(self):
+        if self.rows == 0:
+            return
+        payload = b"".join(self.columns[name][:self.rows].tobytes() for name, _, _ in COLUMNS)
+        if self.compress:
+            payload = zlib.compress(payload, self.compression_level)
+        self.file.write(CHUNK_HEADER.pack(self.rows, len(payload), int(self.compress)))
+        self.file.write(payload)
+        self.rows = 0
+
+    def flush(self):
+        """Flushes the chunks written so far. The steps of the current chunk stay collected until it is full."""
+        self.file.flush()
+
+    def close(self):
+        """Writes the collected steps as a last (smaller) chunk and closes the file"""
+        self.write_chunk()
+        self.file.close()
+
+
+def iter_chunks(path: str) -> Iterator[Dict[str, np.ndarray]]:
+    """Yields the columns of the step log one chunk at a time"""
+    with open(file=path, mode='rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise Exception(path + " is not a binary step log!")
+        while True:
+            header = file.read(CHUNK_HEADER.size)
+            if len(header) == 0:
+                return
+            if len(header) < CHUNK_HEADER.size:
+                raise Exception("The step log " + path + " ends in the middle of a chunk header!")
+            rows, length, compressed = CHUNK_HEADER.unpack(header)
+            payload = file.read(length)
+            if len(payload) < length:
+                raise Exception("The step log " + path + " ends in the middle of a chunk!")
+            if compressed:
+                payload = zlib.decompress(payload)
+
+            chunk = {}
+            offset = 0
+            for name, dtype, shape in COLUMNS:
+                count = rows * int(np.prod(shape, dtype=np.int64))
+                chunk[name] = np.frombuffer(payload, dtype=dtype, count=count, offset=offset).reshape((rows,) + shape)
+                offset += count * np.dtype(dtype).itemsize
+            yield chunk
+
+
+def load(path: str) -> Dict[str, np.ndarray]:
+    """Returns all columns of the step log as NumPy arrays"""
+    chunks = list(iter_chunks(path=path))
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) if len(chunks) > 0
+            else np.zeros((0,) + shape, dtype=dtype) for name, dtype, shape in COLUMNS}
@@ -0,0 +1,166 @@
+import numpy as np
+
+# Resource Types
+LUMBER = 0
+BRICK = 1
+GRAIN = 2
+DESERT = 3
+
+# The static board layout. Every tile is (resource, number, gridpoints) and every gridpoint is
+# (connected tile indexes, connected gridpoint indexes).
+TILE_LAYOUT = [(DESERT, 0, [7, 8, 11, 12, 15, 16]),
+               (LUMBER, 5, [0, 1, 3, 4, 7, 8]),
+               (BRICK, 2, [4, 5, 8, 9, 12, 13]),
+               (BRICK, 5, [12, 13, 16, 17, 20, 21]),
+               (GRAIN, 3, [15, 16, 19, 20, 22, 23]),
+               (LUMBER, 6, [10, 11, 14, 15, 18, 19]),
+               (GRAIN, 3, [2, 3, 6, 7, 10, 11])]
+
+GRIDPOINT_LAYOUT = [([1], [1, 3]),
+                    ([1], [0, 4]),
+                    ([6], [3, 6]),
+                    ([1, 6], [0, 2, 7]),
+                    ([1, 2], [1, 5, 8]),
+                    ([2], [4, 9]),
+                    ([6], [2, 10]),
+                    ([0, 1, 6], [3, 8, 11]),
+                    ([0, 1, 2], [4, 7, 12]),
+                    ([2], [5, 13]),
+                    ([5, 6], [6, 11, 14]),
+                    ([0, 5, 6], [7, 10, 15]),
+                    ([0, 2, 3], [8, 13, 16]),
+                    ([2, 3], [9, 12, 17]),
+                    ([5], [10, 18]),
+                    ([0, 4, 5], [11, 16, 19]),
+                    ([0, 3, 4], [12, 15, 20]),
+                    ([3], [13, 21]),
+                    ([5], [14, 19]),
+                    ([4, 5], [15, 18, 22]),
+                    ([3, 4], [16, 21, 23]),
+                    ([3], [17, 20]),
+                    ([4], [19, 23]),
+                    ([4], [20, 22])]
+
+
+def read_only(x: np.ndarray) -> np.ndarray:
+    x.flags.writeable = False
+    return x
+
+
+class Topology:
+    """The static part of the board: which tiles, gridpoints and connections exist and what they produce.
+    It is compiled once per process and shared by every Board and VecBoard, so it must never be changed."""
+
+    def __init__(self, tile_layout: list, gridpoint_layout: list):
+        self.tile_count = len(tile_layout)
+        self.gridpoint_count = len(gridpoint_layout)
+        self.action_count = 2 * self.gridpoint_count + 1
+        self.obs_size = 3 + 6 * self.gridpoint_count
+        self.all_gridpoints = (1 << self.gridpoint_count) - 1
+
+        for res, number, gps in tile_layout:
+            if res < 0 or res > 3:
+                raise Exception("Invalid resource" + str(res) + "number when creating Tile!")
+            elif len(gps) != 6:
+                raise Exception("Error creating Tile. Not the right amount to GridPoints (6 required, "
+                                + str(len(gps)) + " given)")
+
+        # Tiles
+        self.tile_resources = tuple(res for res, _, _ in tile_layout)
+        self.tile_numbers = tuple(number for _, number, _ in tile_layout)
+        self.tile_probabilities = tuple(0.25 - 0.0625 * abs(5 - number) for _, number, _ in tile_layout)
+        self.tile_gridpoints = tuple(tuple(gps) for _, _, gps in tile_layout)
+        self.tile_masks = tuple(sum(1 << gp for gp in gps) for gps in self.tile_gridpoints)
+
+        # Gridpoints
+        self.gridpoint_tiles = tuple(tuple(tiles) for tiles, _ in gridpoint_layout)
+        self.gridpoint_neighbours = tuple(tuple(gps) for _, gps in gridpoint_layout)
+        self.neighbour_masks = tuple(sum(1 << gp for gp in gps) for gps in self.gridpoint_neighbours)
+
+        resource_values = []
+        for tiles in self.gridpoint_tiles:
+            values = [0, 0, 0]
+            for tile in tiles:
+                if self.tile_resources[tile] == DESERT:
+                    continue
+                values[self.tile_resources[tile]] += self.tile_probabilities[tile]
+            resource_values.append(tuple(values))
+        self.resource_values = tuple(resource_values)
+
+        # For every gridpoint, the (tile, number, resource) triples of the tiles that produce something for it
+        self.gridpoint_production = tuple(tuple((tile, self.tile_numbers[tile], self.tile_resources[tile])
+                                                for tile in tiles if self.tile_resources[tile] != DESERT)
+                                          for tiles in self.gridpoint_tiles)
+
+        # For every dice roll, the (tile, gridpoint, resource) triples that produce something
+        production = [[] for _ in range(max(self.tile_numbers) + 1)]
+        for tile in range(self.tile_count):
+            if self.tile_resources[tile] == DESERT:
+                continue
+            for gp in self.tile_gridpoints[tile]:
+                production[self.tile_numbers[tile]].append((tile, gp, self.tile_resources[tile]))
+        self.production = tuple(tuple(p) for p in production)
+
+        self.compile_tables()
+
+    def compile_tables(self):
+        """Compiles the NumPy versions of the layout used by the vectorized engine"""
+        self.max_degree = max(len(gps) for gps in self.gridpoint_neighbours)
+        neighbour_table = np.zeros((self.gridpoint_count, self.max_degree), dtype=np.int64)
+        neighbour_valid = np.zeros((self.gridpoint_count, self.max_degree), dtype=bool)
+        edge_table = np.zeros((self.gridpoint_count, self.max_degree), dtype=np.int64)
+        edges = {}
+
+        for gi, gps in enumerate(self.gridpoint_neighbours):
+            for slot, neighbour in enumerate(gps):
+                key = (min(gi, neighbour), max(gi, neighbour))
+                if key not in edges:
+                    edges[key] = len(edges)
+                neighbour_table[gi, slot] = neighbour
+                neighbour_valid[gi, slot] = True
+                edge_table[gi, slot] = edges[key]
+
+        # The padded neighbour slots all point to one extra edge that is always saturated
+        edge_table[~neighbour_valid] = len(edges)
+        self.edges = tuple(sorted(edges, key=edges.get))
+        self.edge_count = len(edges)
+
+        tile_yield = np.zeros((self.tile_count, self.gridpoint_count, 3), dtype=np.int64)
+        for tiles in self.production:
+            for tile, gp, res in tiles:
+                tile_yield[tile, gp, res] += 1
+
+        # One extra row of zeros, so a robber index of -1 (no robber) selects no gridpoints
+        tile_gridpoint_table = np.zeros((self.tile_count + 1, self.gridpoint_count), dtype=bool)
+        for tile, gps in enumerate(self.tile_gridpoints):
+            tile_gridpoint_table[tile, list(gps)] = True
+
+        self.neighbour_table = read_only(neighbour_table)
+        self.neighbour_valid = read_only(neighbour_valid)
+        self.edge_table = read_only(edge_table)
+        self.tile_yield = read_only(tile_yield)
+        self.tile_number_table = read_only(np.array(self.tile_numbers, dtype=np.int64))
+        self.tile_gridpoint_table = read_only(tile_gridpoint_table)
+        self.resource_value_table = read_only(np.array(self.resource_values, dtype=np.float32))
+
+        # An observation with only the static resource columns of every gridpoint filled in
+        obs_template = np.zeros(self.obs_size, dtype=np.float32)
+        for res in range(3):
+            obs_template[3 + res::6] = self.resource_value_table[:, res]
+        self.obs_template = read_only(obs_template)
+
+        # Every observation value is (code - offset) / scale for a uint8 code. The resources are stored as they are,
+        # the resource values are multiples of 1/16 and the building, street and robber flags are in {-1, 0, 1}.
+        obs_scale = np.ones(self.obs_size, dtype=np.float32)
+        obs_offset = np.ones(self.obs_size, dtype=np.float32)
+        obs_offset[:3] = 0.0
+        for res in range(3):
+            obs_scale[3 + res::6] = 16.0
+            obs_offset[3 + res::6] = 0.0
+        if not np.array_equal(np.round(obs_template * obs_scale), obs_template * obs_scale):
+            raise Exception("The resource values of the layout are not multiples of 1/16 and cannot be quantized!")
+        self.obs_scale = read_only(obs_scale)
+        self.obs_offset = read_only(obs_offset)
+
+
+TOPOLOGY = Topology(tile_layout=TILE_LAYOUT, gridpoint_layout=GRIDPOINT_LAYOUT)
@@ -0,0 +1,163 @@
+import numpy as np
+
+import Quantization
+from Topology import TOPOLOGY
+
+
+class TrajectoryBuffer:
+    """Holds the transitions of an episode in preallocated arrays, which double in size when they are full.
+    Every observation is stored once, as float32 or, if quantized, as the uint8 codes of the Quantization module.
+    The transitions refer to their state and new state by index, because the new state of a transition is usually
+    the state of the next one and a pass does not change it.
+    The rewards stay float64 so the summed rewards in the logs are not rounded.
+    The actions, rewards and dones are views of the filled part, so they can be patched in place
+    (e.g. rewards[-1] += x), but they are only valid until the next append. The states and new states are
+    rebuilt (and decoded to float32) from the observations on every access."""
+
+    def __init__(self, obs_shape: tuple, action_count: int, capacity=256, quantized=False):
+        if quantized and obs_shape != (TOPOLOGY.obs_size,):
+            raise Exception("Only observations of the board with shape " + str((TOPOLOGY.obs_size,))
+                            + " can be quantized, got " + str(obs_shape))
+
+        self.obs_shape = obs_shape
+        self.action_count = action_count
+        self.quantized = quantized
+        self.size = 0  # The number of transitions
+        self.capacity = 0
+        self.observation_count = 0  # The number of distinct observations
+        self.observation_capacity = 0
+        self.observation_buffer = np.zeros((0,) + obs_shape, dtype=np.uint8 if quantized else np.float32)
+        self.code_buffer = np.zeros(obs_shape, dtype=np.uint8)  # The codes of the observation that is added
+        self.state_index_buffer = np.zeros(0, dtype=np.int64)
+        self.new_state_index_buffer = np.zeros(0, dtype=np.int64)
+        self.action_buffer = np.zeros(0, dtype=np.int64)
+        self.reward_buffer = np.zeros(0, dtype=np.float64)
+        self.value_buffer = np.zeros(0, dtype=np.float64)  # The value estimates at acting time, NaN if unknown
+        self.done_buffer = np.zeros(0, dtype=bool)
+        self.reserve(capacity=capacity)
+
+    @staticmethod
+    def grow(old: np.ndarray, used: int, capacity: int) -> np.ndarray:
+        new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+        new[:used] = old[:used]
+        return new
+
+    def reserve(self, capacity: int, observation_capacity=None):
+        """Makes room for at least capacity transitions and observation_capacity (by default capacity)
+        observations, keeping the ones that are stored"""
+        if observation_capacity is None:
+            observation_capacity = capacity
+        if capacity > self.capacity:
+            for name in ("state_index_buffer", "new_state_index_buffer", "action_buffer", "reward_buffer",
+                         "value_buffer", "done_buffer"):
+                setattr(self, name, self.grow(old=getattr(self, name), used=self.size, capacity=capacity))
+            self.capacity = capacity
+        if observation_capacity > self.observation_capacity:
+            self.observation_buffer = self.grow(old=self.observation_buffer, used=self.observation_count,
+                                                capacity=observation_capacity)
+            self.observation_capacity = observation_capacity
+
+    def add_observation(self, obs) -> int:
+        """Returns the index of the observation, it is only stored if it differs from the last one"""
+        if self.quantized:
+            obs = Quantization.encode(obs=obs, out=self.code_buffer)
+        last = self.observation_count - 1
+        if last >= 0 and np.array_equal(self.observation_buffer[last], obs):
+            return last
+        if self.observation_count == self.observation_capacity:
+            self.observation_buffer = self.grow(old=self.observation_buffer, used=self.observation_count,
+                                                capacity=max(1, 2 * self.observation_capacity))
+            self.observation_capacity = len(self.observation_buffer)
+        self.observation_buffer[self.observation_count] = obs
+        self.observation_count += 1
+        return self.observation_count - 1
+
+    def append(self, state, action: int, reward: float, new_state, done: bool, value=np.nan):
+        if self.size == self.capacity:
+            self.reserve(capacity=max(1, 2 * self.capacity))
+        i = self.size
+        self.state_index_buffer[i] = state_index = self.add_observation(obs=state)
+        self.new_state_index_buffer[i] = state_index if new_state is state else self.add_observation(obs=new_state)
+        self.action_buffer[i] = action
+        self.reward_buffer[i] = reward
+        self.value_buffer[i] = value
+        self.done_buffer[i] = done
+        self.size += 1
+
+    def extend(self, other):
+        """Appends all transitions of another TrajectoryBuffer, e.g. to collect several episodes"""
+        if other.quantized != self.quantized or other.obs_shape != self.obs_shape:
+            raise Exception("Cannot extend a trajectory with one that stores its observations differently!")
+
+        size = self.size + other.size
+        observation_count = self.observation_count + other.observation_count
+        if size > self.capacity or observation_count > self.observation_capacity:
+            self.reserve(capacity=max(size, 2 * self.capacity),
+                         observation_capacity=max(observation_count, 2 * self.observation_capacity))
+
+        self.observation_buffer[self.observation_count:observation_count] = other.observations
+        self.state_index_buffer[self.size:size] = other.state_indexes + self.observation_count
+        self.new_state_index_buffer[self.size:size] = other.new_state_indexes + self.observation_count
+        self.action_buffer[self.size:size] = other.actions
+        self.reward_buffer[self.size:size] = other.rewards
+        self.value_buffer[self.size:size] = other.values
+        self.done_buffer[self.size:size] = other.dones
+        self.size = size
+        self.observation_count = observation_count
+
+    def clear(self):
+        self.size = 0
+        self.observation_count = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def observations(self) -> np.ndarray:
+        """The distinct observations as they are stored, so as codes if quantized"""
+        return self.observation_buffer[:self.observation_count]
+
+    def decode(self, observations: np.ndarray) -> np.ndarray:
+        return Quantization.decode(codes=observations) if self.quantized else observations
+
+    @property
+    def state_indexes(self) -> np.ndarray:
+        return self.state_index_buffer[:self.size]
+
+    @property
+    def new_state_indexes(self) -> np.ndarray:
+        return self.new_state_index_buffer[:self.size]
+
+    @property
+    def states(self) -> np.ndarray:
+        return self.decode(observations=self.observation_buffer[self.state_indexes])
+
+    @property
+    def new_states(self) -> np.ndarray:
+        return self.decode(observations=self.observation_buffer[self.new_state_indexes])
+
+    @property
+    def actions(self) -> np.ndarray:
+        return self.action_buffer[:self.size]
+
+    @property
+    def rewards(self) -> np.ndarray:
+        return self.reward_buffer[:self.size]
+
+    @property
+    def values(self) -> np.ndarray:
+        return self.value_buffer[:self.size]
+
+    @property
+    def dones(self) -> np.ndarray:
+        return self.done_buffer[:self.size]
+
+    def one_hot_actions(self, dtype=np.float32) -> np.ndarray:
+        """Returns the actions as (size, action_count) one-hot vectors"""
+        return one_hot(actions=self.actions, action_count=self.action_count, dtype=dtype)
+
+
+def one_hot(actions: np.ndarray, action_count: int, dtype=np.float32) -> np.ndarray:
+    result = np.zeros((len(actions), action_count), dtype=dtype)
+    result[np.arange(len(actions)), actions] = 1.0
+    return result
@@ -0,0 +1,229 @@
+from typing import Tuple, Union
+
+import numpy as np
+
+from Topology import TOPOLOGY
+
+GRIDPOINT_COUNT = TOPOLOGY.gridpoint_count
+TILE_COUNT = TOPOLOGY.tile_count
+ACTION_COUNT = TOPOLOGY.action_count
+OBS_SIZE = TOPOLOGY.obs_size
+MAX_DEGREE = TOPOLOGY.max_degree
+EDGE_COUNT = TOPOLOGY.edge_count
+NEIGHBOURS = TOPOLOGY.neighbour_table
+NEIGHBOUR_VALID = TOPOLOGY.neighbour_valid
+EDGE_INDEX = TOPOLOGY.edge_table
+RESOURCE_VALUES = TOPOLOGY.resource_value_table
+TILE_YIELD = TOPOLOGY.tile_yield
+TILE_NUMBERS = TOPOLOGY.tile_number_table
+TILE_GRIDPOINTS = TOPOLOGY.tile_gridpoint_table
+
+
+class VecBoard:
+    """Runs N games of the Board rules at once. Players are referred to by their index (0 or 1) and
+    gridpoints store the index + 1 of their owner, just like Board stores the player ID."""
+
+    def __init__(self, num_games: int, winning_reward=10, points_to_win=3, auto_reward_per_step=-0.01,
+                 losing_reward=-10, seed=None):
+        if num_games < 1:
+            raise Exception("A VecBoard needs at least 1 game, got " + str(num_games))
+
+        self.num_games = num_games
+        self.points_to_win = points_to_win
+        self.winning_reward = winning_reward
+        self.losing_reward = losing_reward
+        self.auto_reward_per_step = auto_reward_per_step
+        self.rng = np.random.RandomState(seed)
+        self.games = np.arange(num_games)
+
+        self.buildings = np.zeros((num_games, GRIDPOINT_COUNT), dtype=np.int8)  # 0 or owner index + 1
+        self.edges = np.zeros((num_games, EDGE_COUNT + 1), dtype=np.int8)  # 0 or owner index + 1
+        self.streets = np.zeros((num_games, 2, GRIDPOINT_COUNT), dtype=bool)  # The gps reached by streets
+        self.resources = np.zeros((num_games, 2, 3), dtype=np.int64)
+        self.villages = np.zeros((num_games, 2), dtype=np.int64)
+        self.street_count = np.zeros((num_games, 2), dtype=np.int64)
+        self.taken = np.zeros((num_games, 2, ACTION_COUNT), dtype=bool)  # Same role as Agent.actions_single
+        self.current_player = np.zeros(num_games, dtype=np.int64)
+        self.robber = np.full(num_games, -1, dtype=np.int64)  # The tile index of the robber, -1 if not placed
+        self.edges[:, EDGE_COUNT] = -1
+
+    def _select(self, games) -> np.ndarray:
+        if games is None:
+            return self.games
+        games = np.asarray(games)
+        if games.dtype == bool:
+            return np.flatnonzero(games)
+        return games
+
+    def reset(self, games=None):
+        g = self._select(games)
+        self.buildings[g] = 0
+        self.edges[g] = 0
+        self.edges[g, EDGE_COUNT] = -1
+        self.streets[g] = False
+        self.resources[g] = 0
+        self.villages[g] = 0
+        self.street_count[g] = 0
+        self.taken[g] = False
+        self.robber[g] = -1
+        self.current_player[g] = self.rng.randint(0, 2, size=len(g))
+
+    def get_mask(self, games=None) -> np.ndarray:
+        """Returns the (N, 49) mask of the current players. Like Board.get_mask, True means illegal."""
+        g = self._select(games)
+        p = self.current_player[g]
+        buildings = self.buildings[g]
+        resources = self.resources[g, p]
+        villages = self.villages[g, p]
+        street_count = self.street_count[g, p]
+        streets = self.streets[g, p]
+        taken = self.taken[g, p]
+
+        occupied = buildings != 0
+        free = ~occupied & ~(occupied[:, NEIGHBOURS] & NEIGHBOUR_VALID).any(axis=2)
+
+        connected = (buildings == (p + 1)[:, np.newaxis]) | streets
+        open_edges = self.edges[g][:, EDGE_INDEX] == 0
+        street_ok = (open_edges & connected[:, NEIGHBOURS]).any(axis=2)
+
+        initial_village = (villages < 1)[:, np.newaxis]
+        initial_street = ((villages >= 1) & (street_count < 1))[:, np.newaxis]
+        regular = ~initial_village & ~initial_street
+
+        can_village = (resources >= 1).all(axis=1)[:, np.newaxis]
+        can_street = ((resources[:, 0] >= 1) & (resources[:, 1] >= 1) & (street_count < 7))[:, np.newaxis]
+
+        village_legal = (initial_village & free) | (regular & can_village & free & streets & ~taken[:, 2::2])
+        street_legal = (initial_street & street_ok) | (regular & can_street & street_ok & ~taken[:, 1::2])
+
+        mask = np.empty((len(g), ACTION_COUNT), dtype=bool)
+        mask[:, 0] = ~regular[:, 0]
+        mask[:, 1::2] = ~street_legal
+        mask[:, 2::2] = ~village_legal
+        return mask
+
+    def get_obs(self, games=None, players=None, out=None) -> np.ndarray:
+        """Returns the (N, 147) observations, by default from the perspective of the current players. players is
+        one player index for all games or one per game."""
+        g = self._select(games)
+        p = self.current_player[g] if players is None else np.broadcast_to(np.asarray(players), (len(g),))
+        if out is None:
+            out = np.empty((len(g), OBS_SIZE), dtype=np.float32)
+
+        out[:, :3] = self.resources[g, p]
+        gp_obs = out[:, 3:].reshape(len(g), GRIDPOINT_COUNT, 6)
+        gp_obs[:, :, :3] = RESOURCE_VALUES
+        buildings = self.buildings[g]
+        gp_obs[:, :, 3] = np.where(buildings == 0, 0.0, np.where(buildings == (p + 1)[:, np.newaxis], 1.0, -1.0))
+        gp_obs[:, :, 4] = self.streets[g, p]
+        gp_obs[:, :, 5] = np.where(TILE_GRIDPOINTS[self.robber[g]], -1.0, 0.0)
+        return out
+
+    def dice_roll(self, games=None, rolls=None) -> np.ndarray:
+        """Rolls the dice for the given games and distributes the resources. Returns the rolls."""
+        g = self._select(games)
+        if rolls is None:
+            rolls = self.rng.randint(1, 4, size=len(g)) + self.rng.randint(1, 4, size=len(g))  # 2d3
+        rolls = np.asarray(rolls)
+
+        producing = (TILE_NUMBERS == rolls[:, np.newaxis]) & (np.arange(TILE_COUNT) != self.robber[g, np.newaxis])
+        producing[rolls == 4] = False
+        gp_yield = np.einsum('nt,tgr->ngr', producing.astype(np.int64), TILE_YIELD)
+        owners = self.buildings[g][:, np.newaxis, :] == np.array([1, 2])[np.newaxis, :, np.newaxis]
+        self.resources[g] += np.einsum('npg,ngr->npr', owners.astype(np.int64), gp_yield)
+        return rolls
+
+    def auto_trade(self, games=None):
+        """Trades excess resources of the current players for the resource they have the least of"""
+        g = self._select(games)
+        while len(g) > 0:
+            resources = self.resources[g, self.current_player[g]]
+            h = resources.max(axis=1)
+            l = resources.min(axis=1)
+            trading = (h > 3) & (l < h - 3)
+            g = g[trading]
+            if len(g) == 0:
+                break
+            p = self.current_player[g]
+            self.resources[g, p, resources[trading].argmax(axis=1)] -= 3
+            self.resources[g, p, resources[trading].argmin(axis=1)] += 1
+
+    def winner(self, games=None) -> np.ndarray:
+        """Returns the index of the winning player for every game, or -1 if there is no winner yet"""
+        g = self._select(games)
+        won = self.villages[g] >= self.points_to_win
+        return np.where(won[:, 0], 0, np.where(won[:, 1], 1, -1))
+
+    def next_player(self, games=None):
+        g = self._select(games)
+        if (self.winner(g) >= 0).any():
+            raise Exception("Cannot go to next player if the game is already done!")
+        self.current_player[g] = 1 - self.current_player[g]
+        self.dice_roll(g)
+        self.auto_trade(g)
+
+    def build_buildings(self, games: np.ndarray, actions: np.ndarray) -> np.ndarray:
+        """Executes the non-pass actions for the current players of the given games and returns the rewards"""
+        p = self.current_player[games]
+        gi = (actions - 1) // 2
+        village = (actions - 1) % 2 == 1
+        rewards = np.zeros(len(games))
+
+        vg, vp, vgi = games[village], p[village], gi[village]
+        self.buildings[vg, vgi] = vp + 1
+        self.villages[vg, vp] += 1
+        paying = self.villages[vg, vp] > 1
+        self.resources[vg[paying], vp[paying]] -= 1
+        rewards[village] = 1.0
+
+        sg, sp, sgi = games[~village], p[~village], gi[~village]
+        self.street_count[sg, sp] += 1
+        self.streets[sg, sp, sgi] = True
+        neighbours = NEIGHBOURS[sgi]
+        connected = ((self.buildings[sg[:, np.newaxis], neighbours] == (sp + 1)[:, np.newaxis])
+                     | self.streets[sg[:, np.newaxis], sp[:, np.newaxis], neighbours]) & NEIGHBOUR_VALID[sgi]
+        if not connected.any(axis=1).all():
+            raise Exception("No connection found for a street in games " + str(sg[~connected.any(axis=1)]))
+        # Like Board.find_connection, the last connected neighbour is used
+        slot = MAX_DEGREE - 1 - connected[:, ::-1].argmax(axis=1)
+        connection = neighbours[np.arange(len(sg)), slot]
+        self.streets[sg, sp, connection] = True
+        self.edges[sg, EDGE_INDEX[sgi, slot]] = sp + 1
+        paying = self.street_count[sg, sp] > 1
+        self.resources[sg[paying], sp[paying], :2] -= 1
+
+        self.taken[games, p, actions] = True
+        return rewards
+
+    def step(self, actions: Union[np.ndarray, list]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Executes one action for the current player of every game. Games in which the current player passed
+        are given to the next player, like the driver does for Board, and finished games are reset right away,
+        like in the EnvPool workers. Returns the rewards, dones and the indexes of the players that acted.
+        A game can only be won by the player that acted, so in a done game that player is the winner."""
+        actions = np.asarray(actions, dtype=np.int64)
+        if actions.shape != (self.num_games,):
+            raise Exception("Expected " + str(self.num_games) + " actions, got shape " + str(actions.shape))
+
+        mask = self.get_mask()
+        illegal = mask[self.games, actions]
+        if illegal.any():
+            raise Exception("Something went wrong. Illegal actions were chosen in games " + str(np.flatnonzero(illegal))
+                            + ". Actions taken:" + str(actions[illegal]))
+
+        players = self.current_player.copy()
+        rewards = np.full(self.num_games, self.auto_reward_per_step, dtype=np.float64)
+        building = actions != 0
+        rewards[building] += self.build_buildings(self.games[building], actions[building])
+
+        winner = self.winner()
+        dones = winner >= 0
+        if (dones & ~building).any():
+            raise Exception("Something weird happened. A game was ended with a Pass.")
+        elif (dones & (winner != players)).any():
+            raise Exception("A game cannot be ended by the losing player!")
+        rewards[dones] += self.winning_reward
+
+        self.next_player(self.games[~building])
+        if dones.any():
+            self.reset(self.games[dones])
+        return rewards, dones, players